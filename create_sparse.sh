@@ -6,19 +6,16 @@ metadata_dir=./metadata
 out_dir=/home/sam/Desktop/temp/to_listen/sparse_libri_def # output directory
 stage=0
 fs=16000
+jobs=4 # worker processes
 all_overlap="0.2 0.4 0.6 0.8 1"
 
 set -e
 mkdir -p $out_dir
 
 if [[ $stage -le 0 ]]; then
-    for fs in 8000 16000; do
-      for n_speakers in 2 3; do
-        for ovr_ratio in 0 $all_overlap; do
-          echo "Making mixtures for ${n_speakers} speakers and overlap ${ovr_ratio}"
-          python scripts/make_mixtures.py $metadata_dir/sparse_${n_speakers}_${ovr_ratio}/metadata.json \
-            $librispeech_subdir $out_dir/sparse_${n_speakers}_${ovr_ratio}/wav${fs} --noise_dir $noise_dir --rate $fs
-          done
-      done
-    done
-fi
\ No newline at end of file
+    # all configs and rates are rendered in one process, each LibriSpeech segment is decoded only once.
+    # Stages (render, stats) whose inputs did not change are skipped, mixtures already rendered by a previous
+    # (interrupted) run too. Add --textgrid_dir to also regenerate the metadata (parse, base and overlap stages)
+    python scripts/run_pipeline.py $librispeech_subdir $out_dir --noise_dir $noise_dir \
+      --metadata_dir $metadata_dir --n_speakers 2 3 --ovr_ratios $all_overlap --rates 8000 16000 --jobs $jobs
+fi
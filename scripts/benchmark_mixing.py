@@ -0,0 +1,83 @@
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from utils.mixture_utils import mix_segments
+
+parser = argparse.ArgumentParser("Benchmark of the mixing step (no audio needed, segments are random)")
+parser.add_argument("jsons", nargs="+", help="metadata files, e.g. metadata/sparse_3_*/metadata.json")
+parser.add_argument("--rate", type=int, default=16000)
+parser.add_argument("--n_mixtures", type=int, default=100, help="mixtures used per metadata file")
+parser.add_argument("--seed", type=int, default=0)
+
+
+def pad_and_sum(segments, with_noise):
+    # mixing as done originally in make_mixtures.py, kept as reference
+    sources = {}
+    maxlength = 0
+    for source, offset, signal in segments:
+        audio = np.pad(signal, (offset, 0), "constant")
+        sources.setdefault(source, []).append(audio)
+        maxlength = max(len(audio), maxlength)
+    for s in sources.keys():
+        for i in range(len(sources[s])):
+            tmp = sources[s][i]
+            sources[s][i] = np.pad(tmp, (0, maxlength - len(tmp)), 'constant')
+    streams = {}
+    tot_mixture = None
+    for s in sources.keys():
+        if s == "noise":
+            continue
+        streams[s] = np.sum(sources[s], 0)
+        tot_mixture = streams[s].copy() if tot_mixture is None else tot_mixture + streams[s]
+    streams["mix_clean"] = tot_mixture
+    if with_noise:
+        streams["noise"] = np.sum(sources["noise"], 0)
+        streams["mix_noisy"] = tot_mixture + streams["noise"]
+    return streams
+
+
+def fake_segments(mix, rate, rng):
+    # random segments with the lengths a real render would have
+    segments = []
+    for source in [x for x in mix.keys() if x != "mixture_name"]:
+        for utt in mix[source]:
+            n = int(utt["orig_stop"] * rate) - int(utt["orig_start"] * rate)
+            segments.append((source, int(utt["start"] * rate), rng.standard_normal(n) * 0.05))
+    return segments
+
+
+def run(fn, all_segments):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for segments in all_segments:
+        fn(segments)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    methods = {"pad_and_sum": lambda x: pad_and_sum(x, True),
+               "buffer_float64": lambda x: mix_segments(x, True, np.float64),
+               "buffer_float32": lambda x: mix_segments(x, True, np.float32)}
+
+    print("{:<40} {:<16} {:>10} {:>14}".format("metadata", "method", "time [s]", "peak mem [MB]"))
+    for f in args.jsons:
+        with open(f, "r") as fh:
+            meta = json.load(fh)[:args.n_mixtures]
+        all_segments = [fake_segments(mix, args.rate, rng) for mix in meta]
+
+        ref = [pad_and_sum(x, True) for x in all_segments[:10]]
+        for segments, r in zip(all_segments[:10], ref):
+            out = mix_segments(segments, True)
+            assert all(np.array_equal(out[k], r[k]) for k in r.keys()), "buffer mixing differs from reference"
+
+        for name, fn in methods.items():
+            elapsed, peak = run(fn, all_segments)
+            print("{:<40} {:<16} {:>10.3f} {:>14.1f}".format(f[-40:], name, elapsed, peak / 2 ** 20))
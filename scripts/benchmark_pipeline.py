@@ -0,0 +1,107 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import soundfile as sf
+from make_synthetic_corpus import make_corpus
+from utils.metadata_utils import load_metadata
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser("Time every stage of the pipeline on a synthetic corpus, results as json")
+parser.add_argument("--corpus_dir", type=str, default="",
+                    help="existing output of make_synthetic_corpus.py, default a new one in a temporary dir")
+parser.add_argument("--n_speakers", type=int, default=8)
+parser.add_argument("--n_utts", type=int, default=5, help="utterances per chapter (2 chapters per speaker)")
+parser.add_argument("--n_mixtures", type=int, default=50)
+parser.add_argument("--mix_speakers", type=int, default=2, help="speakers per mixture")
+parser.add_argument("--ovr_ratios", type=float, nargs="+", default=[0.2, 0.4, 0.6, 0.8, 1.0])
+parser.add_argument("--rate", type=int, default=8000)
+parser.add_argument("--jobs", type=int, default=1)
+parser.add_argument("--repeat", type=int, default=1, help="best of this many runs for each stage")
+parser.add_argument("--out_json", type=str, default="", help="also write the results here")
+
+
+def run_stage(script, *args, repeat=1, cache_dir=""):
+    # best wall time of the script run as create_sparse.sh would run it, interpreter startup included.
+    # Header indexes and caches go to cache_dir so that runs start cold and ~/.cache is left alone
+    env = dict(os.environ, SPARSELIBRIMIX_CACHE=cache_dir) if cache_dir else None
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, script)] + [str(x) for x in args], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def audio_seconds(files):
+    return sum(sf.info(f).duration for f in files)
+
+
+def mixture_seconds(metadata):
+    # a mixture lasts until its last segment stops
+    return sum(max(seg["stop"] for k, v in mix.items() if k != "mixture_name" for seg in v) for mix in metadata)
+
+
+def rates(seconds, **counts):
+    out = {"seconds": round(seconds, 4)}
+    for name, count in counts.items():
+        out[name] = count
+        out[name + "_per_s"] = round(count / seconds, 3)
+    return out
+
+
+def benchmark(corpus_dir, work_dir, args):
+    librispeech_dir, textgrid_dir, noise_dir = [os.path.join(corpus_dir, x) for x in
+                                                ["LibriSpeech", "textgrids", "noise"]]
+    flacs = glob.glob(os.path.join(librispeech_dir, "**/*.flac"), recursive=True)
+    cache_dir = os.path.join(work_dir, "cache")
+    stages = {}
+
+    utterances = os.path.join(work_dir, "utterances.json")
+    t = run_stage("parse_utterances.py", librispeech_dir, textgrid_dir, utterances, "--jobs", args.jobs,
+                  "--cache_file", "", repeat=args.repeat, cache_dir=cache_dir)
+    stages["build_utterance_list"] = rates(t, files=len(flacs), audio_seconds=round(audio_seconds(flacs), 3))
+
+    no_ov = os.path.join(work_dir, "sparse_{}_0".format(args.mix_speakers), "metadata.json")
+    t = run_stage("generate_metadata_no_overlap.py", utterances, noise_dir, no_ov, "--n_mixtures",
+                  args.n_mixtures, "--n_speakers", args.mix_speakers, repeat=args.repeat, cache_dir=cache_dir)
+    stages["generate_metadata_no_overlap"] = rates(t, mixtures=args.n_mixtures)
+
+    ov = os.path.join(work_dir, "sparse_{}_{{ovr_ratio}}".format(args.mix_speakers), "metadata.json")
+    t = run_stage("generate_metadata_overlap.py", no_ov, ov, "--ovr_ratio", *args.ovr_ratios, "--random_seed", 0,
+                  repeat=args.repeat, cache_dir=cache_dir)
+    stages["generate_metadata_overlap"] = rates(t, mixtures=args.n_mixtures * len(args.ovr_ratios))
+
+    metadata = load_metadata(no_ov)
+    out_dir = os.path.join(work_dir, "wav{}".format(args.rate))
+    t = run_stage("make_mixtures.py", no_ov, librispeech_dir, out_dir, "--noise_dir", noise_dir, "--rate", args.rate,
+                  "--jobs", args.jobs, repeat=args.repeat, cache_dir=cache_dir)
+    n_files = len(glob.glob(os.path.join(out_dir, "*", "*.wav")))
+    stages["make_mixtures"] = rates(t, mixtures=len(metadata), files=n_files,
+                                    audio_seconds=round(mixture_seconds(metadata), 3))
+    return stages
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus_dir
+        if not corpus_dir:
+            corpus_dir = os.path.join(tmp, "corpus")
+            make_corpus(corpus_dir, n_speakers=args.n_speakers, n_utts=args.n_utts)
+        stages = benchmark(corpus_dir, os.path.join(tmp, "work"), args)
+
+    results = {"python": platform.python_version(), "platform": platform.platform(), "jobs": args.jobs,
+               "rate": args.rate, "stages": stages}
+    print(json.dumps(results, indent=4))
+    if args.out_json:
+        with open(args.out_json, "w") as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,71 @@
+import argparse
+import glob
+import os
+import random
+import tempfile
+import time
+import tgt
+from utils.textgrid_utils import read_words_tier, read_textgrid_words_tgt, merge_word_alignment
+
+parser = argparse.ArgumentParser("Check the streaming TextGrid reader against tgt and time both")
+parser.add_argument("--textgrid_dir", type=str, default="",
+                    help="dir with TextGrids (e.g. librispeech alignments), default synthetic ones")
+parser.add_argument("--n_files", type=int, default=500, help="max number of files")
+parser.add_argument("--repeat", type=int, default=3)
+
+
+def write_synthetic(out_dir, n_files, seed=0):
+    # words tier with pauses, quotes and whitespace only intervals plus a phones tier, long and short format
+    rng = random.Random(seed)
+    vocab = ["the", "a", "cat's", '"quoted"', "sat", " ", "on", "mat"]
+    for i in range(n_files):
+        dur = rng.uniform(2, 30)
+        tg = tgt.TextGrid()
+        words = tgt.IntervalTier(0, dur, name="words")
+        phones = tgt.IntervalTier(0, dur, name="phones")
+        t = round(rng.uniform(0, 0.5), 3)
+        while t < dur - 1:
+            d = round(rng.uniform(0.1, 0.6), 3)
+            words.add_interval(tgt.Interval(t, t + d, rng.choice(vocab)))
+            phones.add_interval(tgt.Interval(t, t + d / 2, "AH"))
+            t = round(t + d + rng.choice([0, 0, 0.05, 0.1, 0.3]), 3)
+        # tier order changes so that the words tier is not always the first one
+        for tier in ([words, phones] if i % 3 else [phones, words]):
+            tg.add_tier(tier)
+        tgt.write_to_file(tg, os.path.join(out_dir, "{:05d}.TextGrid".format(i)),
+                          format="short" if i % 4 == 0 else "long")
+
+
+def time_reader(reader, files, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for f in files:
+            reader(f)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.textgrid_dir:
+            files = sorted(glob.glob(os.path.join(args.textgrid_dir, "**/*.TextGrid"), recursive=True))
+        else:
+            write_synthetic(tmp, args.n_files)
+            files = sorted(glob.glob(os.path.join(tmp, "*.TextGrid")))
+        files = files[:args.n_files]
+
+        for f in files:
+            ref = read_textgrid_words_tgt(f)
+            new = read_words_tier(f)
+            assert ref[0] == new[0] and list(ref[1]) == list(new[1]) and list(ref[2]) == list(new[2]), f
+            for merge_shorter in [0.0, 0.05, 0.15, 0.5]:
+                assert merge_word_alignment(*ref, merge_shorter) == merge_word_alignment(*new, merge_shorter), f
+        print("Same words, times and merged segments as tgt on {} files".format(len(files)))
+
+        t_tgt = time_reader(read_textgrid_words_tgt, files, args.repeat)
+        t_new = time_reader(read_words_tier, files, args.repeat)
+        print("tgt       : {:.3f} s, {:.0f} files/s".format(t_tgt, len(files) / t_tgt))
+        print("streaming : {:.3f} s, {:.0f} files/s ({:.1f}x)".format(t_new, len(files) / t_new, t_tgt / t_new))
@@ -0,0 +1,19 @@
+import argparse
+from utils.audio_index import AudioIndex
+
+parser = argparse.ArgumentParser("Build or incrementally refresh the audio header index of audio roots")
+parser.add_argument("roots", nargs="+", help="e.g. LibriSpeech test-clean and WHAM noise dirs")
+parser.add_argument("--index_file", type=str, default="", help="only with a single root, default is in ~/.cache")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.index_file and len(args.roots) > 1:
+        parser.error("--index_file can be used with a single root only")
+
+    for root in args.roots:
+        index = AudioIndex(root, index_file=args.index_file or None)
+        probed, removed = index.refresh()
+        index.save()
+        print("{} : {} files, {} probed, {} removed, index in {}".format(root, len(index.entries), probed, removed,
+                                                                       index.index_file))
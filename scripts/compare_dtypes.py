@@ -0,0 +1,65 @@
+import argparse
+import json
+import time
+import numpy as np
+from utils.mixture_generator import MixtureGenerator
+from utils.mixture_utils import FLOAT32_TOLERANCE
+
+parser = argparse.ArgumentParser("Error of the float32 render path against float64, on real metadata and audio")
+parser.add_argument("json", help="metadata.json or columnar metadata dir")
+parser.add_argument("librispeech_dir")
+parser.add_argument("--noise_dir", type=str, default="")
+parser.add_argument("--rate", type=int, default=16000)
+parser.add_argument("--n_mixtures", type=int, default=100, help="mixtures compared, from the start of the metadata")
+parser.add_argument("--out_json", type=str, default="", help="also write the report here")
+
+
+def pcm16(x):
+    # samples as libsndfile writes them to a PCM_16 wav (scaled by 0x8000, rounded, clipped)
+    return np.clip(np.rint(np.asarray(x, dtype=np.float64) * 0x8000), -0x8000, 0x7FFF).astype(np.int32)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    generators = {dtype: MixtureGenerator(args.json, args.librispeech_dir, args.noise_dir, args.rate, dtype=dtype)
+                  for dtype in [np.float64, np.float32]}
+    n = min(args.n_mixtures, len(generators[np.float64]))
+
+    report = {}
+    elapsed = {"float64": 0., "float32": 0.}
+    for i in range(n):
+        out = {}
+        for dtype, gen in generators.items():
+            t0 = time.perf_counter()
+            out[dtype] = gen[i]
+            elapsed[np.dtype(dtype).name] += time.perf_counter() - t0
+        ref, approx = out[np.float64], out[np.float32]
+        for s in ref.keys():
+            assert approx[s].dtype == np.float32 and len(approx[s]) == len(ref[s]), s
+            err = np.abs(approx[s].astype(np.float64) - ref[s])
+            lsb = np.abs(pcm16(approx[s]) - pcm16(ref[s]))
+            r = report.setdefault(s, {"max_abs_error": 0., "min_snr_db": np.inf, "max_pcm16_lsb": 0,
+                                      "pcm16_samples_changed": 0, "samples": 0})
+            r["max_abs_error"] = max(r["max_abs_error"], float(err.max(initial=0)))
+            with np.errstate(divide="ignore"):
+                snr = 10 * np.log10(np.sum(ref[s] ** 2) / np.sum(err ** 2))
+            r["min_snr_db"] = min(r["min_snr_db"], float(snr))
+            r["max_pcm16_lsb"] = max(r["max_pcm16_lsb"], int(lsb.max(initial=0)))
+            r["pcm16_samples_changed"] += int(np.count_nonzero(lsb))
+            r["samples"] += len(lsb)
+
+    print("{:<10} {:>14} {:>12} {:>10} {:>16}".format("stream", "max abs error", "min SNR dB", "max LSB",
+                                                        "PCM_16 changed"))
+    for s, r in report.items():
+        print("{:<10} {:>14.3g} {:>12.1f} {:>10d} {:>15.4f}%".format(
+            s, r["max_abs_error"], r["min_snr_db"], r["max_pcm16_lsb"],
+            100 * r["pcm16_samples_changed"] / max(r["samples"], 1)))
+    print("{} mixtures, float64 {:.2f} s, float32 {:.2f} s".format(n, elapsed["float64"], elapsed["float32"]))
+    if args.out_json:
+        with open(args.out_json, "w") as f:
+            json.dump({"mixtures": n, "seconds": elapsed, "tolerance": FLOAT32_TOLERANCE, "streams": report}, f,
+                      indent=4)
+
+    worst = max((r["max_abs_error"] for r in report.values()), default=0.)
+    assert worst < FLOAT32_TOLERANCE, "float32 error {:.3g} over the bound {:.3g}".format(worst, FLOAT32_TOLERANCE)
+    print("float32 within {:.3g} of float64 (max abs error {:.3g})".format(FLOAT32_TOLERANCE, worst))
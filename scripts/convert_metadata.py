@@ -0,0 +1,27 @@
+import argparse
+import json
+import time
+from utils.metadata_utils import load_metadata, save_metadata
+
+parser = argparse.ArgumentParser("Convert metadata between json, json lines (.jsonl) and the columnar format "
+                                 "(dir ending with .cols)")
+parser.add_argument("in_metadata", help="metadata.json, metadata.jsonl or columnar metadata dir")
+parser.add_argument("out_metadata", help="output, columnar if it ends with .cols, json lines if it ends with .jsonl, "
+                                         "json otherwise")
+parser.add_argument("--check", action="store_true", help="reload the output and compare it with the input")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    metadata = load_metadata(args.in_metadata)
+    save_metadata(metadata, args.out_metadata)
+
+    if args.check:
+        t0 = time.perf_counter()
+        converted = load_metadata(args.out_metadata)
+        t_load = time.perf_counter() - t0
+        assert len(converted) == len(metadata)
+        for a, b in zip(metadata, converted):
+            # same values, same key order
+            assert json.dumps(a) == json.dumps(b), a["mixture_name"]
+        print("{} mixtures converted losslessly, output loaded in {:.3f} s".format(len(metadata), t_load))
@@ -0,0 +1,45 @@
+import argparse
+import glob
+import os
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+from tqdm import tqdm
+from utils.shard_utils import ShardWriter, SUBTYPE_DTYPES
+
+parser = argparse.ArgumentParser("Pack a wav tree written by make_mixtures.py (<wav_dir>/<stream>/<mixture>.wav) "
+                                 "into shards")
+parser.add_argument("wav_dir")
+parser.add_argument("out_dir")
+parser.add_argument("--shard_size", type=int, default=1024, help="shard size in MB")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.wav_dir, "*", "*.wav")))
+    if not files:
+        raise FileNotFoundError("No wav found in {}".format(args.wav_dir))
+
+    # group by mixture so that all streams of a mixture end up next to each other
+    mixtures = {}
+    for f in files:
+        mixtures.setdefault(Path(f).stem, []).append(f)
+
+    info = sf.info(files[0])
+    if info.subtype not in SUBTYPE_DTYPES:
+        raise ValueError("Unsupported subtype {}".format(info.subtype))
+    dtype = np.dtype(SUBTYPE_DTYPES[info.subtype])
+
+    with ShardWriter(args.out_dir, info.samplerate, info.subtype, args.shard_size * 2 ** 20) as writer:
+        for name in tqdm(sorted(mixtures.keys())):
+            for f in mixtures[name]:
+                c_info = sf.info(f)
+                if c_info.subtype != info.subtype or c_info.samplerate != info.samplerate:
+                    raise ValueError("{} is {} at {} Hz, expected {} at {} Hz".format(
+                        f, c_info.subtype, c_info.samplerate, info.subtype, info.samplerate))
+                # pcm is read as integers so samples are copied without any conversion
+                signal, _ = sf.read(f, dtype=dtype.name)
+                writer.write_encoded(name, Path(f).parent.name, signal.astype(dtype).tobytes())
+
+    print("Packed {} mixtures in {} shards".format(len(mixtures), len(writer.shards)))
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import soundfile as sf
+from tqdm import tqdm
+from utils.metadata_utils import load_metadata, find_configs
+from utils.mixture_generator import MixtureGenerator
+from utils.stats_utils import SegmentTable, overlap_frames
+from utils.eval_utils import iterate_scores, summarize, source_names
+
+parser = argparse.ArgumentParser("Permutation invariant SI-SDR / SI-SDRi of separated estimates, per mixture and "
+                                 "per config")
+parser.add_argument("metadata_dir", help="directory containing one sub dir with a metadata.json (or .jsonl, .cols) per config")
+parser.add_argument("est_dir", help="estimates, est_dir/<config>/wav<rate>/s<k>/<mixture_name>.wav")
+parser.add_argument("--ref_dir", type=str, default="",
+                    help="rendered mixtures, ref_dir/<config>/wav<rate>/<stream>/<mixture_name>.wav as written by "
+                         "make_mixtures_multi.py")
+parser.add_argument("--librispeech_dir", type=str, default="",
+                    help="render the references in memory instead of reading them from --ref_dir")
+parser.add_argument("--noise_dir", type=str, default="", help="with --librispeech_dir, for noisy mixtures")
+parser.add_argument("--rate", type=int, default=8000)
+parser.add_argument("--configs", type=str, nargs="*", default=None, help="config names to score, default all")
+parser.add_argument("--mixture", type=str, default="", choices=["", "mix_clean", "mix_noisy"],
+                    help="input of the model for SI-SDRi, default mix_noisy when available")
+parser.add_argument("--batch_size", type=int, default=16, help="mixtures scored together")
+parser.add_argument("--prefetch", type=int, default=8, help="mixtures read ahead")
+parser.add_argument("--io_threads", type=int, default=4, help="reading threads")
+parser.add_argument("--out_jsonl", type=str, default="", help="per mixture results, one json per line")
+parser.add_argument("--out_json", type=str, default="", help="per config summary")
+
+
+def read_wav(path):
+    audio, _ = sf.read(path, dtype="float64")
+    return audio if audio.ndim == 1 else audio[:, 0]
+
+
+def est_path(est_dir, source, name):
+    return os.path.join(est_dir, source, name + ".wav")
+
+
+def wav_loader(ref_dir, est_dir, sources, mixture):
+    def load(mix):
+        name = mix["mixture_name"]
+        refs = [read_wav(os.path.join(ref_dir, s, name + ".wav")) for s in sources]
+        ests = [read_wav(est_path(est_dir, s, name)) for s in sources]
+        return name, stack(ests), stack(refs), read_wav(os.path.join(ref_dir, mixture, name + ".wav"))
+    return load
+
+
+def memory_loader(generator, est_dir, mixture):
+    def load(mix):
+        name = mix["mixture_name"]
+        streams = generator.render(mix)
+        sources = source_names(streams)
+        ests = [read_wav(est_path(est_dir, s, name)) for s in sources]
+        return name, stack(ests), stack([streams[s] for s in sources]), streams[mixture]
+    return load
+
+
+def stack(signals):
+    # sources of a mixture may differ by a few samples, they are cut to the shortest
+    t = min(len(x) for x in signals)
+    return np.stack([x[:t] for x in signals])
+
+
+def ratio_of(config):
+    try:
+        return float(config.rsplit("_", 1)[-1])
+    except ValueError:
+        return None
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if bool(args.ref_dir) == bool(args.librispeech_dir):
+        raise SystemExit("Give either --ref_dir (rendered wavs) or --librispeech_dir (references rendered in memory)")
+
+    configs = find_configs(args.metadata_dir, args.configs)
+    out_jsonl = open(args.out_jsonl, "w") if args.out_jsonl else None
+    summary = {}
+    t0 = time.perf_counter()
+    try:
+        for config, path in configs.items():
+            metadata = load_metadata(path)
+            table = SegmentTable(metadata)
+            frames = overlap_frames(table)
+            speech = np.maximum(frames[:, 1:].sum(1), 1)
+            overlapped = frames[:, 2:].sum(1) / speech
+            est_dir = os.path.join(args.est_dir, config, "wav{}".format(args.rate))
+            sources = source_names(metadata[0].keys()) if len(metadata) else []
+            if args.ref_dir:
+                ref_dir = os.path.join(args.ref_dir, config, "wav{}".format(args.rate))
+                mixture = args.mixture or ("mix_noisy" if os.path.isdir(os.path.join(ref_dir, "mix_noisy"))
+                                           else "mix_clean")
+                load = wav_loader(ref_dir, est_dir, sources, mixture)
+            else:
+                mixture = args.mixture or ("mix_noisy" if args.noise_dir else "mix_clean")
+                generator = MixtureGenerator(metadata, args.librispeech_dir, args.noise_dir, args.rate)
+                load = memory_loader(generator, est_dir, mixture)
+
+            records = []
+            scores = iterate_scores(metadata, load, args.batch_size, args.prefetch, args.io_threads)
+            for i, record in enumerate(tqdm(scores, total=len(metadata), desc=config)):
+                # mixtures come back in metadata order, joined with their overlap stats
+                record.update(config=config, overlapped_speech=float(overlapped[i]),
+                              **{"{}spk".format(k): int(frames[i, k]) for k in range(1, frames.shape[1])})
+                records.append(record)
+                if out_jsonl is not None:
+                    out_jsonl.write(json.dumps(record) + "\n")
+                    out_jsonl.flush()
+            summary[config] = dict(summarize(records), ovr_ratio=ratio_of(config), mixture=mixture,
+                                   overlapped_speech=float(frames[:, 2:].sum() / max(frames[:, 1:].sum(), 1)))
+    finally:
+        if out_jsonl is not None:
+            out_jsonl.close()
+
+    print("{:<20} {:>6} {:>9} {:>9} {:>10} {:>9}".format("config", "ratio", "SI-SDR", "SI-SDRi", "overlapped",
+                                                         "mixtures"))
+    for config, s in summary.items():
+        if not s["mixtures"]:
+            continue
+        print("{:<20} {:>6} {:>9.2f} {:>9.2f} {:>9.1f}% {:>9d}".format(
+            config, "" if s["ovr_ratio"] is None else "{:g}".format(s["ovr_ratio"]), s["si_sdr"], s["si_sdri"],
+            100 * s["overlapped_speech"], s["mixtures"]))
+    print("Scored in {:.1f} s".format(time.perf_counter() - t0))
+    if args.out_json:
+        with open(args.out_json, "w") as f:
+            json.dump(summary, f, indent=4)
@@ -4,15 +4,18 @@ import random
 import numpy as np
 import json
 import glob
-import soundfile as sf
 from pathlib import Path
 import collections
+from utils.audio_index import AudioIndex
+from utils.parallel_utils import imap_jobs
+from utils.metadata_utils import save_metadata
 
 
 parser = argparse.ArgumentParser("Generating mixtures")
 parser.add_argument("json_file")
 parser.add_argument("noise_dir")
-parser.add_argument("out_json")
+parser.add_argument("out_json", help="metadata.json, or metadata.jsonl to write one mixture per line as they are "
+                                     "generated")
 parser.add_argument("--n_mixtures", default=1000,  type=int)
 parser.add_argument("--n_speakers", default=3,  type=int)
 parser.add_argument('--ovr_ratio', type=float, default=0.0,
@@ -21,9 +24,17 @@ parser.add_argument("--maxlength", type=int, default=15)
 parser.add_argument('--random_seed', type=int, default=777,
                     help='random seed')
 parser.add_argument("--version", type=int, default=1)
+parser.add_argument("--rng", type=str, default="legacy", choices=["legacy", "counter"],
+                    help="legacy : one global random stream, same output as before for a given seed. "
+                         "counter : each mixture has its own generators derived from (seed, mixture index), "
+                         "mixtures can be generated in parallel and independently")
+parser.add_argument("--jobs", type=int, default=1,
+                    help="worker processes with --rng counter, output is identical for any value")
 
+MAX_ATTEMPTS = 1000 # --rng counter, draws of a mixture before giving up on finding a long enough noise
 
-def find_sub_utts_subsets(c_utt, minlen):
+
+def find_sub_utts_subsets(c_utt, minlen, np_rng=np.random):
     valid = []
     for i in range(len(c_utt)): # O(n**2)
         sum_till_now = 0
@@ -39,193 +50,207 @@ def find_sub_utts_subsets(c_utt, minlen):
         start, stop = valid[-1]
         return c_utt[start:stop+1]
     else:
-        return [np.random.choice(c_utt)] # all utterances are longer
-
-
-if __name__ == "__main__":
-    args = parser.parse_args()
-    VERSION = args.version
+        return [np_rng.choice(c_utt)] # all utterances are longer
 
-    os.makedirs(Path(args.out_json).parent, exist_ok=True)
-    random.seed(args.random_seed)
-    np.random.seed(args.random_seed)
-
-    f_name = Path(args.noise_dir).name + f'_max{args.maxlength}s.json'
-    if os.path.isfile(f_name):
-        print("Loading noise file lists")
-        with open(f_name, 'r') as f:
-            noises = json.load(f)
-    else:
-        noises = glob.glob(os.path.join(args.noise_dir, "**/*.wav"), recursive=True)
-        prev_len = len(noises)
-        noises = [x for x in noises if len(sf.SoundFile(x)) >= args.maxlength*sf.SoundFile(x).samplerate]
-        print("Number of noise wavs : {}".format(len(noises)))
-        print("Discarded : {}".format(prev_len - len(noises)))
-        with open(f_name, 'w') as f:
-            json.dump(noises, f)
-    ######
-
-    with open(args.json_file, "r") as f:
-        utterances = json.load(f)
 
+def make_mixture(recid, utterances, noises, noise_info, args, rng=random, np_rng=np.random):
+    # metadata of one mixture, None when the noise is too short for it. rng and np_rng are the random and
+    # np.random modules (legacy, shared sequential stream) or per mixture generators (see mixture_rngs)
     all_speakers = list(utterances.keys())
-    total_metadata = []
-    mix_n = 0
-    while mix_n < args.n_mixtures:
-
-        # recording ids are mix_0000001, mix_0000002, ...
-        recid = 'mix_{:07d}'.format(mix_n + 1)
-        c_speakers = random.sample(all_speakers, args.n_speakers) # could be made weighted
-        metadata = []
-        maxlength = -1
-
-        # we sample all utterances at once from different librispeech files
-        utts = [random.choice(utterances[spk]) for spk in c_speakers]
-        # we get min length in seconds for all speakers
-
-        mindur_spk = np.inf
-        for spk_indx in range(len(utts)):
-            tmp = 0
-            for sub_utt in utts[spk_indx]:
-                tmp += sub_utt["stop"] - sub_utt["start"]
-            mindur_spk = min(tmp, mindur_spk)
-
-        # having minimum duration we keep adding utterances from one speaker till we have minimum duration
-        kept = []
-        for spk_indx in range(len(utts)):
-            tmp = find_sub_utts_subsets(utts[spk_indx], mindur_spk)
-            kept.append(tmp[::-1]) # we use pop after thus we reverse here
-        utts = kept
-
-        lasts = {}
-        for i in c_speakers:
-            lasts[i] = [0, 0]
-
-        overlap_stat = 0
-        tot = 0
-        sub_utt_num = 0
-        while np.any(utts): # till we have utterances
-            if tot == 0:
-                spk_indx = 0
-                prev_spk_indx = 1
-            else:
-                prev_spk_indx = spk_indx
-                spk_indx = random.choice([x for x in range(len(c_speakers)) if x != prev_spk_indx])
-
-            # if number of sub_utts for this speaker is greater than n sub utts of all other
-            # we can afford to not overlap this utterance on the left
-            try:
-                sub_utt = utts[spk_indx].pop()
-            except:
-                continue # no more utterances for this speaker
-
-            c_spk = c_speakers[spk_indx]
-            prev_spk = c_speakers[prev_spk_indx]
-
-            if lasts[prev_spk][-1] != 0:
-                # not first utterance
-                if VERSION == 1:
-                    stop = min([x for x in [lasts[x][-1] for x in c_speakers if x != c_spk] if x != 0])
-                    start = max([x for x in [lasts[x][0] for x in c_speakers if x != c_spk] if x != 0])
-                    lastlen = stop - start
-                    if args.ovr_ratio != 0:
-                        raise NotImplemented
-                    else:
-                        # This should always be the stop of the previous speaker.
-                        it = max([x for x in [lasts[x][-1] for x in c_speakers] if x != 0]) + 0.05
-                elif VERSION == 2:
-                    start, stop = lasts[prev_spk]
-                    lastlen = stop - start
-                    if args.ovr_ratio != 0:
-                        raise NotImplemented
-                    else:
-                        # This should always be the stop of the previous speaker.
-                        it = max([x for x in [lasts[x][-1] for x in c_speakers] if x != 0]) + 0.05
-                elif VERSION == 3:
-                    c_length = sub_utt["stop"] - sub_utt["start"]
-                    stop = min([x for x in [lasts[x][-1] for x in c_speakers if x != c_spk] if x != 0])
-                    start = max([x for x in [lasts[x][0] for x in c_speakers if x != c_spk] if x != 0])
-                    lastlen = stop - start
-                    if args.ovr_ratio != 0:
-                        raise NotImplemented
-
-                    else:
-                        # This should always be the stop of the previous speaker.
-                        it = max([x for x in [lasts[x][-1] for x in c_speakers] if x != 0]) + 0.05
+    c_speakers = rng.sample(all_speakers, args.n_speakers) # could be made weighted
+    metadata = []
+    maxlength = -1
+
+    # we sample all utterances at once from different librispeech files
+    utts = [rng.choice(utterances[spk]) for spk in c_speakers]
+    # we get min length in seconds for all speakers
+
+    mindur_spk = np.inf
+    for spk_indx in range(len(utts)):
+        tmp = 0
+        for sub_utt in utts[spk_indx]:
+            tmp += sub_utt["stop"] - sub_utt["start"]
+        mindur_spk = min(tmp, mindur_spk)
+
+    # having minimum duration we keep adding utterances from one speaker till we have minimum duration
+    kept = []
+    for spk_indx in range(len(utts)):
+        tmp = find_sub_utts_subsets(utts[spk_indx], mindur_spk, np_rng)
+        kept.append(tmp[::-1]) # we use pop after thus we reverse here
+    utts = kept
+
+    lasts = {}
+    for i in c_speakers:
+        lasts[i] = [0, 0]
+
+    overlap_stat = 0
+    tot = 0
+    sub_utt_num = 0
+    while any(len(x) for x in utts): # till we have utterances
+        if tot == 0:
+            spk_indx = 0
+            prev_spk_indx = 1
+        else:
+            prev_spk_indx = spk_indx
+            spk_indx = rng.choice([x for x in range(len(c_speakers)) if x != prev_spk_indx])
+
+        # if number of sub_utts for this speaker is greater than n sub utts of all other
+        # we can afford to not overlap this utterance on the left
+        try:
+            sub_utt = utts[spk_indx].pop()
+        except:
+            continue # no more utterances for this speaker
+
+        c_spk = c_speakers[spk_indx]
+        prev_spk = c_speakers[prev_spk_indx]
+
+        if lasts[prev_spk][-1] != 0:
+            # not first utterance
+            if args.version == 1:
+                stop = min([x for x in [lasts[x][-1] for x in c_speakers if x != c_spk] if x != 0])
+                start = max([x for x in [lasts[x][0] for x in c_speakers if x != c_spk] if x != 0])
+                lastlen = stop - start
+                if args.ovr_ratio != 0:
+                    raise NotImplemented
+                else:
+                    # This should always be the stop of the previous speaker.
+                    it = max([x for x in [lasts[x][-1] for x in c_speakers] if x != 0]) + 0.05
+            elif args.version == 2:
+                start, stop = lasts[prev_spk]
+                lastlen = stop - start
+                if args.ovr_ratio != 0:
+                    raise NotImplemented
                 else:
-                    raise ValueError
+                    # This should always be the stop of the previous speaker.
+                    it = max([x for x in [lasts[x][-1] for x in c_speakers] if x != 0]) + 0.05
+            elif args.version == 3:
+                c_length = sub_utt["stop"] - sub_utt["start"]
+                stop = min([x for x in [lasts[x][-1] for x in c_speakers if x != c_spk] if x != 0])
+                start = max([x for x in [lasts[x][0] for x in c_speakers if x != c_spk] if x != 0])
+                lastlen = stop - start
+                if args.ovr_ratio != 0:
+                    raise NotImplemented
 
-                # if offset == 0# no overlap maybe we can use pauses between utterances
+                else:
+                    # This should always be the stop of the previous speaker.
+                    it = max([x for x in [lasts[x][-1] for x in c_speakers] if x != 0]) + 0.05
             else:
-                it = np.random.uniform(0.2, 0.5)  # first utterance
-
-            maxlength = max(maxlength, it + (sub_utt["stop"] - sub_utt["start"]))
-
-            c_meta = {"file": "/".join(sub_utt["file"].split("/")[-3:]), "words": sub_utt["words"],
-                      "spk_id": sub_utt["spk_id"],
-                      "chapter_id": sub_utt["chapter_id"], "utt_id": sub_utt["utt_id"],
-                      "start": np.round(it, 3),
-                      "stop": np.round(it + (sub_utt["stop"] - sub_utt["start"]), 3),
-                      "orig_start": sub_utt["start"],
-                      "orig_stop": sub_utt["stop"], "lvl":  np.random.uniform( -33, -25),
-                      "source": "s{}".format(spk_indx + 1), "sub_utt_num": sub_utt_num }
-            metadata.append(c_meta)
-            lasts[c_spk][0] = c_meta["start"]
-            lasts[c_spk][1] = c_meta["stop"]  # can't overlap with itself
-            tot += c_meta["stop"] - c_meta["start"]
-            sub_utt_num += 1
-
-        ## noise ##
-        maxlength += np.random.uniform(0.2, 0.5) # ASR purposes we add some silence at end
-        noise = np.random.choice(noises)
-        # if noisefile is more than maxlength then we take a random window
-        if len(sf.SoundFile(noise)) - int(maxlength * sf.SoundFile(noise).samplerate) <= 0 :
-            print("TEST ONLY too long utterance skipping utt")
+                raise ValueError
+
+            # if offset == 0# no overlap maybe we can use pauses between utterances
+        else:
+            it = np_rng.uniform(0.2, 0.5)  # first utterance
+
+        maxlength = max(maxlength, it + (sub_utt["stop"] - sub_utt["start"]))
+
+        c_meta = {"file": "/".join(sub_utt["file"].split("/")[-3:]), "words": sub_utt["words"],
+                  "spk_id": sub_utt["spk_id"],
+                  "chapter_id": sub_utt["chapter_id"], "utt_id": sub_utt["utt_id"],
+                  "start": np.round(it, 3),
+                  "stop": np.round(it + (sub_utt["stop"] - sub_utt["start"]), 3),
+                  "orig_start": sub_utt["start"],
+                  "orig_stop": sub_utt["stop"], "lvl":  np_rng.uniform( -33, -25),
+                  "source": "s{}".format(spk_indx + 1), "sub_utt_num": sub_utt_num }
+        metadata.append(c_meta)
+        lasts[c_spk][0] = c_meta["start"]
+        lasts[c_spk][1] = c_meta["stop"]  # can't overlap with itself
+        tot += c_meta["stop"] - c_meta["start"]
+        sub_utt_num += 1
+
+    ## noise ##
+    maxlength += np_rng.uniform(0.2, 0.5) # ASR purposes we add some silence at end
+    noise = np_rng.choice(noises)
+    noise_len, noise_fs = noise_info[noise]
+    # if noisefile is more than maxlength then we take a random window
+    if noise_len - int(maxlength * noise_fs) <= 0 :
+        print("TEST ONLY too long utterance skipping utt")
+        return None
+    offset = rng.randint(0, noise_len - int(maxlength*noise_fs))
+    c_lvl = np_rng.uniform(-38, -30) #np.clip(first_lvl - rng.normalvariate(3.47, 4), -40, 0)
+
+    metadata.append({"file": noise.split("/")[-1],
+                     "start": 0,
+                     "stop": maxlength, "orig_start": np.round(offset/noise_fs, 3),
+                     "orig_stop": np.round(offset/noise_fs + maxlength, 3),
+                     "lvl": c_lvl, "source": "noise", "channel": rng.randint(0,1)})
+
+    mixture_metadata = {"mixture_name": recid}
+    for elem in metadata:
+        if elem["source"] not in mixture_metadata.keys():
+            mixture_metadata[elem["source"]] = [elem]
+        else:
+            mixture_metadata[elem["source"]].append(elem)
+    return mixture_metadata
+
+
+def mixture_rngs(seed, index, attempt=0):
+    # independent (random.Random, np.random.Generator) for mixture index, only depends on (seed, index, attempt)
+    py_seq, np_seq = np.random.SeedSequence([seed, index, attempt]).spawn(2)
+    return random.Random(int.from_bytes(py_seq.generate_state(8).tobytes(), "little")), np.random.default_rng(np_seq)
+
+
+_worker = None
+
+
+def init_worker(utterances, noises, noise_info, args):
+    global _worker
+    _worker = (utterances, noises, noise_info, args)
+
+
+def counter_mixture(mix_n):
+    # mixture mix_n with --rng counter, a draw without a long enough noise is retried with the next attempt
+    utterances, noises, noise_info, args = _worker
+    for attempt in range(MAX_ATTEMPTS):
+        rng, np_rng = mixture_rngs(args.random_seed, mix_n, attempt)
+        mixture = make_mixture('mix_{:07d}'.format(mix_n + 1), utterances, noises, noise_info, args, rng, np_rng)
+        if mixture is not None:
+            return mixture
+    raise RuntimeError("no noise long enough after {} attempts".format(MAX_ATTEMPTS))
+
+
+def generate_mixtures(utterances, noises, noise_info, args):
+    # yields the args.n_mixtures mixtures in order
+    mix_n = 0
+    if args.rng == "counter":
+        for mixture_metadata in imap_jobs(counter_mixture, range(args.n_mixtures), args.jobs, init_worker,
+                                          (utterances, noises, noise_info, args), chunksize=16):
+            yield mixture_metadata
+            mix_n += 1
+    while mix_n < args.n_mixtures:
+        # legacy : every draw comes from the global stream, a skipped mixture shifts all the next ones
+        # recording ids are mix_0000001, mix_0000002, ...
+        mixture_metadata = make_mixture('mix_{:07d}'.format(mix_n + 1), utterances, noises, noise_info, args)
+        if mixture_metadata is None:
             continue
-        offset = random.randint(0, len(sf.SoundFile(noise)) - int(maxlength*sf.SoundFile(noise).samplerate))
-        c_lvl = np.random.uniform(-38, -30) #np.clip(first_lvl - random.normalvariate(3.47, 4), -40, 0)
-
-        metadata.append({"file": noise.split("/")[-1],
-                         "start": 0,
-                         "stop": maxlength, "orig_start": np.round(offset/sf.SoundFile(noise).samplerate, 3),
-                         "orig_stop": np.round(offset/sf.SoundFile(noise).samplerate + maxlength, 3),
-                         "lvl": c_lvl, "source": "noise", "channel": random.randint(0,1)})
-
-        mixture_metadata = {"mixture_name": recid}
-        for elem in metadata:
-            if elem["source"] not in mixture_metadata.keys():
-                mixture_metadata[elem["source"]] = [elem]
-            else:
-                mixture_metadata[elem["source"]].append(elem)
-
-        total_metadata.append(mixture_metadata)
+        yield mixture_metadata
         mix_n += 1
 
-    with open(os.path.join(args.out_json), "w") as f:
-        json.dump(total_metadata, f, indent=4)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
+def main(args):
+    if args.rng == "legacy" and args.jobs > 1:
+        raise SystemExit("--jobs needs --rng counter, the legacy stream is sequential")
 
+    os.makedirs(Path(args.out_json).parent, exist_ok=True)
+    random.seed(args.random_seed)
+    np.random.seed(args.random_seed)
 
+    # noise headers come from the persistent header index of noise_dir, only new or modified files are probed
+    noise_index = AudioIndex(args.noise_dir)
+    noises = glob.glob(os.path.join(args.noise_dir, "**/*.wav"), recursive=True)
+    prev_len = len(noises)
+    noises = [x for x in noises if noise_index.frames(x) >= args.maxlength*noise_index.samplerate(x)]
+    noise_index.save()
+    noise_info = {x: (noise_index.frames(x), noise_index.samplerate(x)) for x in noises}
+    print("Number of noise wavs : {}".format(len(noises)))
+    print("Discarded : {}".format(prev_len - len(noises)))
+    ######
 
+    with open(args.json_file, "r") as f:
+        utterances = json.load(f)
 
+    # mixtures are written as they are generated, a .jsonl out_json is streamed to disk
+    save_metadata(generate_mixtures(utterances, noises, noise_info, args), args.out_json)
 
 
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,48 @@
+import argparse
+import os
+from contextlib import ExitStack
+from pathlib import Path
+import numpy as np
+from utils.overlap_utils import iter_overlaps, format_ratio
+from utils.metadata_utils import iter_metadata, MetadataWriter
+
+parser = argparse.ArgumentParser("generate overlap metadata for many ratios and speaker counts in one process")
+parser.add_argument("out_dir", help="metadata dir, outputs go to out_dir/<name>_<ratio>/metadata.json (.jsonl, .cols)")
+parser.add_argument("--no_ov_metadata", type=str, nargs="+",
+                    default=["metadata/sparse_2_0/metadata.json", "metadata/sparse_3_0/metadata.json"],
+                    help="no overlap metadata (json, jsonl or columnar), <name> is their parent dir without the last _0 "
+                         "(e.g. sparse_2_0 -> sparse_2)")
+parser.add_argument("--ovr_ratios", type=float, nargs="+", default=[0.2, 0.4, 0.6, 0.8, 1.0])
+parser.add_argument("--ovr_step", type=float, default=0,
+                    help="if > 0 sweeps ratios from ovr_step to 1 with this step instead of --ovr_ratios")
+parser.add_argument("--version", type=int, default=1)
+parser.add_argument("--random_seed", type=int, default=None)
+parser.add_argument("--format", type=str, default="json", choices=["json", "jsonl", "columnar"],
+                    help="output format, metadata.json, metadata.jsonl or metadata.cols. With jsonl input and "
+                         "output mixtures are streamed, memory does not grow with their number")
+
+
+def config_prefix(no_ov_metadata):
+    name = Path(no_ov_metadata).parent.name
+    return name.rsplit("_", 1)[0] if "_" in name else name
+
+
+def main(args):
+    ratios = args.ovr_ratios
+    if args.ovr_step > 0:
+        ratios = [float(x) for x in np.round(np.arange(1, int(round(1 / args.ovr_step)) + 1) * args.ovr_step, 6)]
+
+    out_name = {"json": "metadata.json", "jsonl": "metadata.jsonl", "columnar": "metadata.cols"}[args.format]
+    for no_ov_metadata in args.no_ov_metadata:
+        prefix = config_prefix(no_ov_metadata)
+        with ExitStack() as stack:
+            writers = [stack.enter_context(MetadataWriter(
+                os.path.join(args.out_dir, "{}_{}".format(prefix, format_ratio(ratio)), out_name))) for ratio in ratios]
+            for mixes in iter_overlaps(iter_metadata(no_ov_metadata), ratios, args.version, args.random_seed):
+                for writer, mix in zip(writers, mixes):
+                    writer.write(mix)
+        print("{}: {} mixtures, {} ratios".format(prefix, writers[0].n_mixtures, len(ratios)))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
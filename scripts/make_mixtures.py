@@ -1,126 +1,259 @@
 import argparse
 import json
+import time
 from tqdm import tqdm
-import soundfile as sf
-import numpy as np
-import os
-import pyloudnorm
-from scipy.signal import resample_poly
+from utils.mixture_utils import write_mixture, mixture_paths
+from utils.audio_index import AudioIndexes
+from utils.mixture_generator import MixtureGenerator
+from utils.parallel_utils import imap_jobs, WorkerError
+from utils.shard_utils import ShardWriter, encode
+from utils.metadata_utils import load_metadata
+from utils.manifest_utils import Manifest, mixture_hash, render_params
+from utils.profiling_utils import StageTimer, WindowProfiler, get_timer, set_timer
+from utils.pipeline_utils import prefetch, BackgroundWorker
+from utils.locality_utils import locality_order, estimated_saved_seconds
+from utils.partition_utils import select_shard, mixture_duration
 
 parser = argparse.ArgumentParser()
-parser.add_argument("json")
+parser.add_argument("json", help="metadata.json, metadata.jsonl or columnar metadata dir")
 parser.add_argument("librispeech_dir")
 parser.add_argument('out_dir',help='output data dir of mixture')
 parser.add_argument("--noise_dir", type=str, default="")
 parser.add_argument('--rate', type=int, default=16000,
                     help='sampling rate')
-
-args = parser.parse_args()
-
-if not args.noise_dir:
-    print("Generating only clean version")
-
-with open(args.json, "r") as f:
-    total_meta = json.load(f)
-
-
-def resample_and_norm(signal, orig, target, lvl):
-
-    if orig != target:
-        signal = resample_poly(signal, target, orig)
-
-    #fx = (AudioEffectsChain().custom("norm {}".format(lvl)))
-    #signal = fx(signal)
-
-    meter = pyloudnorm.Meter(target, block_size=0.1)
-    loudness = meter.integrated_loudness(signal)
-    signal = pyloudnorm.normalize.loudness(signal, loudness, lvl)
-
-    return signal
-
-for mix in tqdm(total_meta):
-    filename = mix["mixture_name"]
-    sources_list = [x for x in mix.keys() if x != "mixture_name"]
-
-    sources = {}
-    maxlength = 0
-    for source in sources_list:
-        # read file optional resample it
-        source_utts = []
-        for utt in mix[source]:
-            if utt["source"] != "noise": # speech file
-                utt["file"] = os.path.join(args.librispeech_dir, utt["file"])
+parser.add_argument("--jobs", type=int, default=1,
+                    help="number of worker processes, output is identical for any value")
+parser.add_argument("--cache_dir", type=str, default="",
+                    help="persistent cache of decoded, resampled and normalized segments")
+parser.add_argument("--cache_size", type=float, default=10,
+                    help="cache size limit in GB, least recently used segments are evicted")
+parser.add_argument("--dtype", type=str, default="float64", choices=["float64", "float32"],
+                    help="dtype used from decoding to mixing, float32 halves memory traffic (see compare_dtypes.py)")
+parser.add_argument("--subtype", type=str, default="PCM_16", choices=["PCM_16", "FLOAT"],
+                    help="sample format of the written wavs or shards")
+parser.add_argument("--output_format", type=str, default="wav", choices=["wav", "shard"],
+                    help="one wav per mixture and stream, or a few large shards with an index.json")
+parser.add_argument("--shard_size", type=int, default=1024, help="shard size in MB")
+parser.add_argument("--resume", action="store_true",
+                    help="skip mixtures already rendered with the same metadata and params (wav output only)")
+parser.add_argument("--verify", action="store_true",
+                    help="with --resume also check the sha1 of existing files, not only their size")
+parser.add_argument("--manifest_every", type=int, default=100,
+                    help="save the manifest every this many mixtures")
+parser.add_argument("--profile", action="store_true",
+                    help="time each phase (read, resample, loudness, mix, encode, write) and show live rates")
+parser.add_argument("--profile_json", type=str, default="", help="write the profile summary here, implies --profile")
+parser.add_argument("--profile_window", type=int, nargs=2, default=None, metavar=("START", "STOP"),
+                    help="run cProfile on mixtures START to STOP (positions in the metadata to render)")
+parser.add_argument("--profile_out", type=str, default="make_mixtures.prof", help="cProfile output of --profile_window")
+parser.add_argument("--pipeline", action="store_true",
+                    help="single process read -> render -> write pipeline with prefetch and writer threads")
+parser.add_argument("--prefetch", type=int, default=8, help="mixtures decoded ahead in --pipeline mode")
+parser.add_argument("--io_threads", type=int, default=4, help="decoding threads in --pipeline mode")
+parser.add_argument("--write_queue", type=int, default=4, help="rendered mixtures waiting to be written in --pipeline mode")
+parser.add_argument("--locality", action="store_true",
+                    help="render mixtures sharing source files together, each file is decoded once while in the "
+                         "decoded file cache and its segments are sliced from it")
+parser.add_argument("--file_cache_size", type=float, default=1, help="decoded file cache size in GB for --locality")
+parser.add_argument("--shard", type=int, default=0,
+                    help="work shard rendered by this run (0 based), out of --num_shards, see merge_shards.py")
+parser.add_argument("--num_shards", type=int, default=1,
+                    help="split the mixtures in this many work shards of about the same audio duration")
+
+_args = None
+_generator = None
+_profiler = None
+_profile_names = set()
+
+
+def init_worker(args, index, profile_names=()):
+    global _args, _generator, _profiler, _profile_names
+    _args = args
+    _generator = MixtureGenerator([], args.librispeech_dir, args.noise_dir, args.rate,
+                                  cache_dir=args.cache_dir, cache_size=args.cache_size, dtype=args.dtype,
+                                  index=index, file_cache_size=args.file_cache_size if args.locality else 0)
+    if args.profile or args.profile_json:
+        set_timer(StageTimer())
+    _profile_names = set(profile_names)
+    _profiler = WindowProfiler(args.profile_out) if _profile_names else None
+
+
+def write_streams(mix, streams):
+    timer = get_timer()
+    timer.add("audio_seconds", len(streams["mix_clean"]) / _args.rate)
+    if _args.output_format == "shard":
+        # encoded here, shards are written by the parent process
+        with timer.phase("encode"):
+            out = [(s, encode(signal, _args.subtype)) for s, signal in streams.items()]
+        timer.add("bytes_written", sum(len(x[-1]) for x in out))
+        return out
+    return write_mixture(_args.out_dir, mix["mixture_name"], streams, _args.rate, _args.subtype)
+
+
+def render_and_write(mix):
+    return write_streams(mix, _generator.render(mix))
+
+
+def counters():
+    # segment cache and decoded file cache counters of this process
+    out = {}
+    if _generator.cache is not None:
+        out.update(cache_hits=_generator.cache.hits, cache_misses=_generator.cache.misses)
+    if _generator.file_cache is not None:
+        out.update(_generator.file_cache.stats())
+    return out
+
+
+def make_mixture(mix):
+    before = counters()
+    if mix["mixture_name"] in _profile_names:
+        out = _profiler.run(render_and_write, mix)
+    else:
+        out = render_and_write(mix)
+    counts = {k: v - before[k] for k, v in counters().items()}
+    return mix["mixture_name"], out, counts, get_timer().pop()
+
+
+def pipelined_mixtures(total_meta, args, index, profile_names=()):
+    # same results as imap_jobs(make_mixture, ...) in metadata order, but in one process : segments of the next
+    # args.prefetch mixtures are decoded by args.io_threads threads while this thread renders, and up to
+    # args.write_queue rendered mixtures wait for the writer thread. Memory is bounded by the two depths.
+    init_worker(args, index, profile_names)
+
+    def write(mix, streams):
+        return mix["mixture_name"], write_streams(mix, streams)
+
+    def done(results, before):
+        # counters are attributed to the mixtures written since the previous call
+        for name, out in results:
+            now = counters()
+            yield name, out, {k: v - before[k] for k, v in now.items()}, get_timer().pop()
+            before.update(now)
+
+    before = counters()
+    with BackgroundWorker(write, args.write_queue) as writer:
+        for mix, decoded in zip(total_meta, prefetch(_generator.read, total_meta, args.prefetch, args.io_threads)):
+            if mix["mixture_name"] in _profile_names:
+                streams = _profiler.run(_generator.render, mix, decoded)
             else:
-                if args.noise_dir:
-                    utt["file"] = os.path.join(args.noise_dir, utt["file"])
-                else:
-                    continue
-
-            utt_fs = sf.SoundFile(utt["file"]).samplerate
-            audio, fs = sf.read(utt["file"], start=int(utt["orig_start"]*utt_fs),
-                            stop=int(utt["orig_stop"]*utt_fs))
-
-            #assert len(audio.shape) == 1, "we currently not support multichannel"
-            if len(audio.shape) > 1:
-                audio = audio[:, utt["channel"]] #TODO
-            audio = audio - np.mean(audio) # zero mean cos librispeech is messed up sometimes
-            audio = resample_and_norm(audio, fs, args.rate, utt["lvl"])
-            audio = np.pad(audio, (int(utt["start"]*args.rate), 0), "constant") # pad the beginning
-            source_utts.append(audio)
-            maxlength = max(len(audio), maxlength)
-
-        sources[source] = source_utts
-
-    # pad everything to same length
-    for s in sources.keys():
-        for i in range(len(sources[s])):
-            tmp = sources[s][i]
-            sources[s][i] = np.pad(tmp,  (0, maxlength-len(tmp)), 'constant')
-
-    # mix n sum
-    tot_mixture = None
-    for indx, s in enumerate(sources.keys()):
-        if s == "noise":
-            continue
-        source_mix = np.sum(sources[s], 0)
-        os.makedirs(os.path.join(args.out_dir, s), exist_ok=True)
-        sf.write(os.path.join(args.out_dir, s, filename + ".wav"), source_mix, args.rate)
-        if indx == 0:
-            tot_mixture = source_mix
+                streams = _generator.render(mix, decoded)
+            writer.submit(mix, streams)
+            yield from done(writer.completed(), before)
+        yield from done(writer.close(), before)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if not args.noise_dir:
+        print("Generating only clean version")
+
+    total_meta = load_metadata(args.json)
+
+    params = render_params(args.rate, args.librispeech_dir, args.noise_dir, args.dtype, args.subtype)
+    if args.num_shards > 1:
+        # e.g. one shard per machine, each in its own out_dir, merged with merge_shards.py
+        n_all = len(total_meta)
+        total_meta = select_shard(total_meta, args.shard, args.num_shards)
+        print("Shard {}/{} : {} of {} mixtures, {:.2f} h of audio".format(
+            args.shard, args.num_shards, len(total_meta), n_all, sum(map(mixture_duration, total_meta)) / 3600))
+        params["shard"] = {"index": args.shard, "num_shards": args.num_shards}
+    elif args.shard != 0:
+        raise SystemExit("--shard needs --num_shards")
+
+    manifest = None
+    if args.output_format == "wav":
+        manifest = Manifest(args.out_dir, params)
+        if args.resume:
+            manifest.remove_stale_tmp()
+            n_done = len(total_meta)
+            total_meta = [mix for mix in total_meta if not manifest.is_valid(mix, args.verify)]
+            print("Resuming, {} mixtures up to date, {} to render".format(n_done - len(total_meta),
+                                                                         len(total_meta)))
         else:
-            tot_mixture += source_mix
-
-    os.makedirs(os.path.join(args.out_dir, "mix_clean"), exist_ok=True)
-    sf.write(os.path.join(args.out_dir, "mix_clean", filename + ".wav"), tot_mixture, args.rate)
-
-    if args.noise_dir:
-        s = "noise"
-        source_mix = np.sum(sources[s], 0)
-        os.makedirs(os.path.join(args.out_dir, s), exist_ok=True)
-        sf.write(os.path.join(args.out_dir, s, filename + ".wav"), source_mix, args.rate)
-        tot_mixture += source_mix
-        os.makedirs(os.path.join(args.out_dir, "mix_noisy"), exist_ok=True)
-        sf.write(os.path.join(args.out_dir, "mix_noisy", filename + ".wav"), tot_mixture, args.rate)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+            manifest.clear()
+    elif args.resume:
+        raise SystemExit("--resume is only supported with --output_format wav")
+    if args.pipeline and (args.jobs > 1 or args.cache_dir):
+        raise SystemExit("--pipeline runs in a single process and does not use --cache_dir")
+    hashes = {mix["mixture_name"]: mixture_hash(mix) for mix in total_meta} if manifest is not None else {}
+
+    # headers of all the files we need are looked up (and probed if new) once here, workers get a copy
+    index = AudioIndexes([args.librispeech_dir, args.noise_dir])
+    for mix in total_meta:
+        for path in mixture_paths(mix, args.librispeech_dir, args.noise_dir):
+            index.info(path)
+    index.save()
+
+    writer = None
+    if args.output_format == "shard":
+        writer = ShardWriter(args.out_dir, args.rate, args.subtype, args.shard_size * 2 ** 20, params=params)
+
+    timer = StageTimer() if args.profile or args.profile_json else None
+    profile_names = []
+    if args.profile_window is not None:
+        profile_names = [mix["mixture_name"] for mix in total_meta[args.profile_window[0]:args.profile_window[1]]]
+
+    if args.locality:
+        # mixtures sharing source files are rendered one after the other (and by the same worker, chunks are
+        # consecutive), the output order changes but not the outputs
+        total_meta = [total_meta[i] for i in locality_order(total_meta, args.librispeech_dir, args.noise_dir)]
+
+    totals = {}
+    t0 = time.perf_counter()
+    try:
+        # shards are filled in metadata order so that their layout does not depend on --jobs
+        if args.pipeline:
+            results = pipelined_mixtures(total_meta, args, index, profile_names)
+        else:
+            results = imap_jobs(make_mixture, total_meta, args.jobs, init_worker, (args, index, profile_names),
+                                chunksize=16 if args.locality else 1, ordered=writer is not None)
+        progress = tqdm(results, total=len(total_meta))
+        for n, (name, out, counts, stats) in enumerate(progress):
+            if timer is not None:
+                # worker stats, in this process the worker timer is the global one and is popped too
+                timer.merge(stats)
+                if n % 10 == 0:
+                    progress.set_postfix(timer.postfix(time.perf_counter() - t0), refresh=False)
+            if writer is not None:
+                for s, payload in out:
+                    writer.write_encoded(name, s, payload)
+            else:
+                manifest.record(name, hashes[name], out)
+                if (n + 1) % args.manifest_every == 0:
+                    manifest.save()
+            for k, v in counts.items():
+                totals[k] = totals.get(k, 0) + v
+    except WorkerError as e:
+        raise SystemExit("Rendering stopped, {}".format(e))
+    finally:
+        # mixtures completed so far are kept also when stopped, they are skipped by --resume
+        if manifest is not None:
+            manifest.save()
+
+    if writer is not None:
+        writer.close()
+
+    if timer is not None:
+        summary = timer.summary(time.perf_counter() - t0, len(total_meta))
+        for k, v in summary["phases"].items():
+            if v["background"]:
+                # e.g. reads of the --pipeline I/O threads, in parallel with the phases above
+                print("{:<10} {:8.2f} thread-s {:7d} calls {:5.1f} % of wall time (background threads)".format(
+                    k, v["seconds"], v["calls"], 100 * v["share"]))
+            else:
+                print("{:<10} {:8.2f} s {:7d} calls {:5.1f} %".format(k, v["seconds"], v["calls"], 100 * v["share"]))
+        print(", ".join("{} {:.2f}".format(k, v) for k, v in summary["rates"].items()))
+        if args.profile_json:
+            with open(args.profile_json, "w") as f:
+                json.dump(summary, f, indent=4)
+    if profile_names:
+        if WindowProfiler(args.profile_out).merge() is not None:
+            print("cProfile of {} mixtures written to {}".format(len(profile_names), args.profile_out))
+
+    if args.cache_dir:
+        print("Segment cache hits : {}, misses : {}".format(totals.get("cache_hits", 0), totals.get("cache_misses", 0)))
+    if args.locality and "files_opened" in totals:
+        print("Files opened : {} for {} segments, decoding {:.2f} s, estimated time saved {:.2f} s".format(
+            totals["files_opened"], totals["segments"], totals["open_seconds"] + totals["decode_seconds"],
+            estimated_saved_seconds(totals)))
@@ -0,0 +1,225 @@
+import argparse
+import os
+import numpy as np
+from tqdm import tqdm
+from utils.mixture_utils import render_mixture, write_mixture, read_utterance, resample_and_norm, \
+    read_key, segment_key, mixture_paths
+from utils.audio_index import AudioIndexes
+from utils.segment_cache import SegmentCache
+from utils.shard_utils import ShardWriter, encode
+from utils.metadata_utils import load_metadata, find_configs
+from utils.manifest_utils import Manifest, mixture_hash, render_params
+from utils.locality_utils import DecodedFileCache, shared_files_order, estimated_saved_seconds
+from utils.parallel_utils import imap_jobs, WorkerError
+
+parser = argparse.ArgumentParser("Render several metadata configs and sampling rates in a single pass")
+parser.add_argument("metadata_dir", help="directory containing one sub dir with a metadata.json (or .jsonl, .cols) per config")
+parser.add_argument("librispeech_dir")
+parser.add_argument('out_dir', help='mixtures are written to out_dir/<config>/wav<rate>')
+parser.add_argument("--noise_dir", type=str, default="")
+parser.add_argument("--rates", type=int, nargs="+", default=[8000, 16000])
+parser.add_argument("--configs", type=str, nargs="*", default=None,
+                    help="config names to render (e.g. sparse_2_0.2), default all")
+parser.add_argument("--cache_dir", type=str, default="",
+                    help="persistent cache of decoded, resampled and normalized segments")
+parser.add_argument("--cache_size", type=float, default=10,
+                    help="cache size limit in GB, least recently used segments are evicted")
+parser.add_argument("--dtype", type=str, default="float64", choices=["float64", "float32"],
+                    help="dtype used from decoding to mixing, float32 halves memory traffic (see compare_dtypes.py)")
+parser.add_argument("--subtype", type=str, default="PCM_16", choices=["PCM_16", "FLOAT"],
+                    help="sample format of the written wavs or shards")
+parser.add_argument("--output_format", type=str, default="wav", choices=["wav", "shard"],
+                    help="one wav per mixture and stream, or a few large shards with an index.json")
+parser.add_argument("--shard_size", type=int, default=1024, help="shard size in MB")
+parser.add_argument("--resume", action="store_true",
+                    help="skip mixtures already rendered with the same metadata and params (wav output only)")
+parser.add_argument("--verify", action="store_true",
+                    help="with --resume also check the sha1 of existing files, not only their size")
+parser.add_argument("--manifest_every", type=int, default=100,
+                    help="save the manifests every this many mixture indexes")
+parser.add_argument("--locality", action="store_true",
+                    help="render mixture indexes sharing source files together, each file is decoded once while "
+                         "in the decoded file cache and its segments are sliced from it")
+parser.add_argument("--file_cache_size", type=float, default=1, help="decoded file cache size in GB for --locality")
+parser.add_argument("--jobs", type=int, default=1,
+                    help="worker processes, each renders all the configs and rates of a mixture index")
+
+
+class SegmentMemo:
+    # segments of the sparse_N_* configs share file, orig_start, orig_stop and lvl, only start/stop change.
+    # Here each segment is decoded once for all rates and resampled/normalized once per rate, in dtype.
+    def __init__(self, cache=None, index=None, file_cache=None, dtype=np.float64):
+        self.cache = cache
+        self.index = index
+        self.dtype = dtype
+        self.file_cache = file_cache # locality_utils.DecodedFileCache, lives across mixture indexes
+        self.decoded = {}
+        self.processed = {}
+        self.n_reads = 0
+        self.n_requests = 0
+
+    def clear(self):
+        self.decoded = {}
+        self.processed = {}
+
+    def load(self, utt, path, rate):
+        self.n_requests += 1
+        key = segment_key(utt, path, rate)
+        if key not in self.processed:
+            if self.cache is not None:
+                self.processed[key] = self.cache.load(utt, path, rate, compute=self._process)
+            else:
+                self.processed[key] = self._process(utt, path, rate)
+        return self.processed[key]
+
+    def _process(self, utt, path, rate):
+        r_key = read_key(utt, path)
+        if r_key not in self.decoded:
+            if self.file_cache is not None:
+                self.decoded[r_key] = self.file_cache.read(utt, path)
+            else:
+                self.decoded[r_key] = read_utterance(utt, path, self.index, self.dtype)
+            self.n_reads += 1
+        audio, fs = self.decoded[r_key]
+        return resample_and_norm(audio, fs, rate, utt["lvl"])
+
+
+_worker = None
+
+
+def init_worker(args, metas, index):
+    global _worker
+    # mixture i of every config is rendered together, the memo only lives for one mixture index
+    cache = SegmentCache(args.cache_dir, int(args.cache_size * 2 ** 30), params={"dtype": args.dtype}) \
+        if args.cache_dir else None
+    file_cache = DecodedFileCache(int(args.file_cache_size * 2 ** 30), args.dtype) if args.locality else None
+    _worker = (args, metas, SegmentMemo(cache, index, file_cache, args.dtype))
+
+
+def counters(memo):
+    # counters of this process, summed over the processes by the parent
+    out = {"requests": memo.n_requests, "reads": memo.n_reads}
+    if memo.cache is not None:
+        out.update(cache_hits=memo.cache.hits, cache_misses=memo.cache.misses, cache_evicted=memo.cache.evicted)
+    if memo.file_cache is not None:
+        out.update(memo.file_cache.stats())
+    return out
+
+
+def render_index(task):
+    # renders mixture i of the given (rate, config) pairs. Wavs are written here, shards are encoded here and
+    # written by the parent process
+    i, todo = task
+    args, metas, memo = _worker
+    before = counters(memo)
+    out = []
+    for rate, name in todo:
+        mix = metas[name][i]
+        c_out = os.path.join(args.out_dir, name, "wav{}".format(rate))
+        streams = render_mixture(mix, args.librispeech_dir, args.noise_dir, rate, load=memo.load, dtype=args.dtype)
+        if args.output_format == "shard":
+            out.append((c_out, rate, mix, [(s, encode(signal, args.subtype)) for s, signal in streams.items()]))
+        else:
+            out.append((c_out, rate, mix, write_mixture(c_out, mix["mixture_name"], streams, rate, args.subtype)))
+    memo.clear()
+    return out, {k: v - before.get(k, 0) for k, v in counters(memo).items()}
+
+
+def main(args):
+
+    if not args.noise_dir:
+        print("Generating only clean version")
+
+    configs = find_configs(args.metadata_dir, args.configs)
+    metas = {}
+    for name, f in configs.items():
+        metas[name] = load_metadata(f)
+    print("Rendering {} configs at rates {}".format(len(metas), args.rates))
+    if args.resume and args.output_format != "wav":
+        raise SystemExit("--resume is only supported with --output_format wav")
+
+    manifests = {}
+    if args.output_format == "wav":
+        for name in metas.keys():
+            for rate in args.rates:
+                c_out = os.path.join(args.out_dir, name, "wav{}".format(rate))
+                manifests[c_out] = Manifest(c_out, render_params(rate, args.librispeech_dir, args.noise_dir,
+                                                                 args.dtype, args.subtype))
+                if args.resume:
+                    manifests[c_out].remove_stale_tmp()
+                else:
+                    manifests[c_out].clear()
+
+    n_mixtures = max(len(x) for x in metas.values())
+    order = range(n_mixtures)
+    # headers of all the files we need are looked up (and probed if new) once here, workers get a copy
+    index = AudioIndexes([args.librispeech_dir, args.noise_dir])
+    paths = [{p for meta in metas.values() if i < len(meta)
+              for p in mixture_paths(meta[i], args.librispeech_dir, args.noise_dir)} for i in range(n_mixtures)]
+    for files in paths:
+        for path in files:
+            index.info(path)
+    index.save()
+    if args.locality:
+        order = shared_files_order(paths)
+
+    # (mixture index, (rate, config) pairs to render), mixtures already rendered are skipped with --resume
+    tasks = []
+    n_skipped = 0
+    for i in order:
+        todo = []
+        for rate in args.rates:
+            for name, meta in metas.items():
+                if i >= len(meta):
+                    continue
+                c_out = os.path.join(args.out_dir, name, "wav{}".format(rate))
+                if args.resume and manifests[c_out].is_valid(meta[i], args.verify):
+                    n_skipped += 1
+                    continue
+                todo.append((rate, name))
+        if todo:
+            tasks.append((i, todo))
+
+    writers = {}
+    totals = {}
+    try:
+        # shards are filled in mixture order so that their layout does not depend on --jobs
+        results = imap_jobs(render_index, tasks, args.jobs, init_worker, (args, metas, index),
+                            chunksize=16 if args.locality else 1, ordered=args.output_format == "shard")
+        for n, (out, counts) in enumerate(tqdm(results, total=len(tasks))):
+            for c_out, rate, mix, files in out:
+                if args.output_format == "shard":
+                    if c_out not in writers:
+                        writers[c_out] = ShardWriter(c_out, rate, args.subtype, args.shard_size * 2 ** 20)
+                    for s, payload in files:
+                        writers[c_out].write_encoded(mix["mixture_name"], s, payload)
+                else:
+                    manifests[c_out].record(mix["mixture_name"], mixture_hash(mix), files)
+            for k, v in counts.items():
+                totals[k] = totals.get(k, 0) + v
+            if (n + 1) % args.manifest_every == 0:
+                for manifest in manifests.values():
+                    manifest.save()
+    except WorkerError as e:
+        raise SystemExit("Rendering stopped, {}".format(e))
+    finally:
+        # mixtures completed so far are kept also when stopped, they are skipped by --resume
+        for manifest in manifests.values():
+            manifest.save()
+
+    for writer in writers.values():
+        writer.close()
+    if args.resume:
+        print("Resumed, {} mixtures were up to date".format(n_skipped))
+
+    print("Segments requested : {}, decoded : {}".format(totals.get("requests", 0), totals.get("reads", 0)))
+    if args.locality and totals:
+        print("Files opened : {} for {} segments, decoding {:.2f} s, estimated time saved {:.2f} s".format(
+            totals["files_opened"], totals["segments"], totals["open_seconds"] + totals["decode_seconds"],
+            estimated_saved_seconds(totals)))
+    if args.cache_dir:
+        print("Segment cache hits : {}, misses : {}, evicted : {}".format(
+            totals.get("cache_hits", 0), totals.get("cache_misses", 0), totals.get("cache_evicted", 0)))
+
+if __name__ == "__main__":
+    main(parser.parse_args())
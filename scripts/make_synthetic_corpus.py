@@ -0,0 +1,92 @@
+import argparse
+import os
+import numpy as np
+import soundfile as sf
+
+parser = argparse.ArgumentParser("Build a small fake LibriSpeech + alignments + WHAM corpus for tests and benchmarks")
+parser.add_argument("out_dir", help="LibriSpeech, textgrids and noise dirs are created here")
+parser.add_argument("--n_speakers", type=int, default=8)
+parser.add_argument("--n_chapters", type=int, default=2, help="chapters per speaker")
+parser.add_argument("--n_utts", type=int, default=5, help="utterances per chapter")
+parser.add_argument("--n_noises", type=int, default=8)
+parser.add_argument("--noise_len", type=float, default=30, help="noise duration in seconds")
+parser.add_argument("--rate", type=int, default=16000)
+parser.add_argument("--random_seed", type=int, default=0)
+
+
+def random_alignment(rng, duration):
+    # words of 0.2-0.6 s separated by short gaps and sometimes by pauses longer than merge_shorter
+    words = []
+    t = rng.uniform(0.2, 0.5)
+    while True:
+        d = rng.uniform(0.2, 0.6)
+        if t + d > duration - 0.2:
+            break
+        words.append(("w{}".format(rng.randint(1000)), round(t, 3), round(t + d, 3)))
+        t = t + d + (rng.uniform(0.3, 0.8) if rng.rand() < 0.2 else rng.uniform(0.0, 0.1))
+    return words
+
+
+def write_textgrid(path, words, duration):
+    # long format with a single words tier, gaps are "" intervals as in MFA alignments
+    intervals = []
+    t = 0.0
+    for w, s, e in words:
+        if s > t:
+            intervals.append(("", t, s))
+        intervals.append((w, s, e))
+        t = e
+    if t < duration:
+        intervals.append(("", t, duration))
+    lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', "",
+             "xmin = 0", "xmax = {}".format(duration), "tiers? <exists>", "size = 1", "item []:",
+             "    item [1]:", '        class = "IntervalTier"', '        name = "words"',
+             "        xmin = 0", "        xmax = {}".format(duration),
+             "        intervals: size = {}".format(len(intervals))]
+    for i, (w, s, e) in enumerate(intervals):
+        lines += ["        intervals [{}]:".format(i + 1), "            xmin = {}".format(s),
+                  "            xmax = {}".format(e), '            text = "{}"'.format(w)]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def make_utterance(rng, words, duration, rate):
+    # random noise at speech level inside words and a much lower floor outside, so that the SNR filter of
+    # build_utterance_list keeps the files
+    audio = rng.randn(int(duration * rate)) * 1e-4
+    for _, s, e in words:
+        audio[int(s * rate):int(e * rate)] *= rng.uniform(300, 1000)
+    return np.clip(audio, -1, 1)
+
+
+def make_corpus(out_dir, n_speakers=8, n_chapters=2, n_utts=5, n_noises=8, noise_len=30, rate=16000, seed=0):
+    """Writes out_dir/LibriSpeech/<spk>/<chapter>/<spk>-<chapter>-<utt>.flac, the matching TextGrids in
+    out_dir/textgrids and stereo noise wavs in out_dir/noise. Returns the three dirs."""
+    rng = np.random.RandomState(seed)
+    dirs = {k: os.path.join(out_dir, k) for k in ["LibriSpeech", "textgrids", "noise"]}
+    for spk in range(n_speakers):
+        spk_id = str(100 + spk)
+        for chapter in range(n_chapters):
+            chapter_id = str(1000 * (spk + 1) + chapter)
+            for d in [dirs["LibriSpeech"], dirs["textgrids"]]:
+                os.makedirs(os.path.join(d, spk_id, chapter_id), exist_ok=True)
+            for utt in range(n_utts):
+                utt_id = "{}-{}-{:04d}".format(spk_id, chapter_id, utt)
+                duration = round(rng.uniform(3, 15), 3)
+                words = random_alignment(rng, duration)
+                sf.write(os.path.join(dirs["LibriSpeech"], spk_id, chapter_id, utt_id + ".flac"),
+                         make_utterance(rng, words, duration, rate), rate)
+                write_textgrid(os.path.join(dirs["textgrids"], spk_id, chapter_id, utt_id + ".TextGrid"),
+                               words, duration)
+    os.makedirs(dirs["noise"], exist_ok=True)
+    for i in range(n_noises):
+        noise = rng.randn(int(noise_len * rate), 2) * rng.uniform(0.01, 0.1)
+        sf.write(os.path.join(dirs["noise"], "noise_{:03d}.wav".format(i)), noise, rate)
+    return dirs["LibriSpeech"], dirs["textgrids"], dirs["noise"]
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    dirs = make_corpus(args.out_dir, args.n_speakers, args.n_chapters, args.n_utts, args.n_noises, args.noise_len,
+                       args.rate, args.random_seed)
+    print("LibriSpeech : {}\nTextGrids : {}\nNoise : {}".format(*dirs))
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import shutil
+from utils.metadata_utils import load_metadata
+from utils.manifest_utils import Manifest, MANIFEST_NAME
+from utils.shard_utils import INDEX_NAME
+from utils.partition_utils import shard_positions
+
+parser = argparse.ArgumentParser("Merge the out dirs of make_mixtures.py --shard i --num_shards N into one")
+parser.add_argument("json", help="metadata.json or columnar metadata dir the shards were rendered from")
+parser.add_argument("out_dir", help="merged output dir, can be one of the shard dirs")
+parser.add_argument("shard_dirs", nargs="+", help="out dir of every shard, in any order")
+parser.add_argument("--copy", action="store_true", help="copy the files instead of moving them")
+parser.add_argument("--verify", action="store_true", help="check the sha1 of every wav, not only its size")
+
+# params that may differ between machines, the audio they point to must be the same
+LOCAL_PARAMS = ["librispeech_dir", "noise_dir"]
+
+
+def read_shard_dir(shard_dir):
+    # (format, params, raw manifest or index) of a shard out dir
+    for fmt, name in [("wav", MANIFEST_NAME), ("shard", INDEX_NAME)]:
+        path = os.path.join(shard_dir, name)
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                content = json.load(f)
+            return fmt, content.get("params", {}), content
+    raise SystemExit("{} has no {} or {}, was it rendered to the end ?".format(shard_dir, MANIFEST_NAME, INDEX_NAME))
+
+
+def common_params(params):
+    return {k: v for k, v in params.items() if k not in LOCAL_PARAMS + ["shard"]}
+
+
+def check_shards(shards):
+    # shards : list of (dir, format, params, content), returns them sorted by shard index
+    infos = [params.get("shard") for _, _, params, _ in shards]
+    if any(x is None for x in infos):
+        raise SystemExit("Not rendered with --num_shards : {}".format(
+            [d for (d, _, _, _), x in zip(shards, infos) if x is None]))
+    num_shards = infos[0]["num_shards"]
+    if any(x["num_shards"] != num_shards for x in infos):
+        raise SystemExit("Shards were rendered with different --num_shards : {}".format(
+            sorted({x["num_shards"] for x in infos})))
+    found = {}
+    for shard, x in zip(shards, infos):
+        if x["index"] in found:
+            raise SystemExit("Shard {} given twice : {} and {}".format(x["index"], found[x["index"]][0], shard[0]))
+        found[x["index"]] = shard
+    missing = sorted(set(range(num_shards)) - set(found.keys()))
+    if missing:
+        raise SystemExit("Missing shards {} of {}".format(missing, num_shards))
+
+    ref_dir, ref_fmt, ref_params, _ = found[0]
+    for d, fmt, params, _ in found.values():
+        if fmt != ref_fmt:
+            raise SystemExit("{} and {} have different output formats".format(ref_dir, d))
+        if common_params(params) != common_params(ref_params) or \
+                bool(params.get("noise_dir")) != bool(ref_params.get("noise_dir")):
+            raise SystemExit("{} and {} were rendered with different params : {} {}".format(
+                ref_dir, d, common_params(ref_params), common_params(params)))
+    return [found[i] for i in range(num_shards)]
+
+
+def transfer(src, dst, copy):
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if copy:
+        shutil.copy2(src, dst)
+    else:
+        shutil.move(src, dst)
+
+
+def merge_wav(metadata, shards, positions, out_dir, copy=False, verify=False):
+    manifests = [Manifest(d, params) for d, _, params, _ in shards]
+    incomplete = []
+    for (d, _, _, _), manifest, pos in zip(shards, manifests, positions):
+        bad = [metadata[i]["mixture_name"] for i in pos if not manifest.is_valid(metadata[i], verify)]
+        if bad:
+            incomplete.append("{} : {} of {} mixtures missing or changed (e.g. {})".format(
+                d, len(bad), len(pos), ", ".join(bad[:3])))
+    if incomplete:
+        raise SystemExit("Incomplete shards, render them again with --resume :\n" + "\n".join(incomplete))
+
+    params = dict(shards[0][2])
+    del params["shard"]
+    merged = Manifest(out_dir, params)
+    merged.clear()
+    owner = {i: manifest for manifest, pos in zip(manifests, positions) for i in pos}
+    n_files = 0
+    for i in sorted(owner.keys()):
+        name = metadata[i]["mixture_name"]
+        manifest = owner[i]
+        entry = manifest.entries[name]
+        for stream in entry["files"].keys():
+            transfer(manifest.file_path(name, stream), merged.file_path(name, stream), copy)
+            n_files += 1
+        merged.record(name, entry["meta"], entry["files"])
+    merged.save()
+    if not copy:
+        # shard manifests point to moved files now
+        for manifest in manifests:
+            if os.path.abspath(manifest.out_dir) != os.path.abspath(out_dir):
+                os.remove(manifest.path)
+                for stream in os.listdir(manifest.out_dir):
+                    if os.path.isdir(os.path.join(manifest.out_dir, stream)) and \
+                            not os.listdir(os.path.join(manifest.out_dir, stream)):
+                        os.rmdir(os.path.join(manifest.out_dir, stream))
+    return n_files
+
+
+def merge_shard_files(metadata, shards, positions, out_dir, copy=False):
+    indexes = [content for _, _, _, content in shards]
+    streams = None
+    for (d, _, _, index), pos in zip(shards, positions):
+        names = {}
+        for e in index["entries"]:
+            names.setdefault(e["mixture_name"], set()).add(e["stream"])
+        streams = streams or next(iter(names.values()), set())
+        expected = {metadata[i]["mixture_name"] for i in pos}
+        bad = sorted(x for x in expected if names.get(x) != streams) + sorted(set(names.keys()) - expected)
+        if bad:
+            raise SystemExit("{} does not hold the mixtures of its shard (e.g. {})".format(d, ", ".join(bad[:3])))
+
+    os.makedirs(out_dir, exist_ok=True)
+    files, entries = [], []
+    for (d, _, _, index) in shards:
+        base = len(files)
+        for x in index["shards"]:
+            name = "shard_{:05d}.bin".format(len(files))
+            files.append((os.path.join(d, x), os.path.join(out_dir, name)))
+        entries.extend(dict(e, shard=e["shard"] + base) for e in index["entries"])
+    # sources are renamed in place in order, a target can be the source of a later file when out_dir is a shard dir
+    tmp = [(src, dst + ".merge.tmp") for src, dst in files]
+    for src, dst in tmp:
+        transfer(src, dst, copy)
+    for (_, dst), (_, t) in zip(files, tmp):
+        os.replace(t, dst)
+
+    params = dict(indexes[0].get("params", {}))
+    del params["shard"]
+    merged = {k: indexes[0][k] for k in ["version", "rate", "subtype", "dtype"]}
+    merged.update(params=params, shards=[os.path.basename(dst) for _, dst in files], entries=entries)
+    with open(os.path.join(out_dir, INDEX_NAME + ".tmp"), "w") as f:
+        json.dump(merged, f)
+    os.replace(os.path.join(out_dir, INDEX_NAME + ".tmp"), os.path.join(out_dir, INDEX_NAME))
+    if not copy:
+        for d, _, _, _ in shards:
+            if os.path.abspath(d) != os.path.abspath(out_dir):
+                os.remove(os.path.join(d, INDEX_NAME))
+    return len(files)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    metadata = load_metadata(args.json)
+    shards = check_shards([(d,) + read_shard_dir(d) for d in args.shard_dirs])
+    positions = shard_positions(metadata, len(shards))
+
+    if shards[0][1] == "wav":
+        n_files = merge_wav(metadata, shards, positions, args.out_dir, args.copy, args.verify)
+    else:
+        n_files = merge_shard_files(metadata, shards, positions, args.out_dir, args.copy)
+    print("Merged {} shards, {} mixtures ({} files) into {}".format(len(shards), len(metadata), n_files,
+                                                                     args.out_dir))
@@ -0,0 +1,103 @@
+import argparse
+import glob
+import json
+import os
+import time
+from pathlib import Path
+from utils.metadata_utils import load_metadata, is_columnar
+from utils.stats_utils import SegmentTable, overlap_stats, speaker_stats, validate
+
+parser = argparse.ArgumentParser("Overlap and speaker statistics (stats/overlaps.json, stats/speakers.json) "
+                                 "and overlap ratio validation, from the metadata only")
+parser.add_argument("metadata", nargs="+",
+                    help="metadata.json files, columnar dirs, config dirs or metadata dirs holding config dirs "
+                         "(e.g. the output of generate_overlap_sweep.py)")
+parser.add_argument("--frame_rate", type=int, default=100, help="frames per second of overlaps.json")
+parser.add_argument("--write", action="store_true",
+                    help="write stats/overlaps.json and stats/speakers.json next to every metadata file")
+parser.add_argument("--stats_dir", type=str, default="",
+                    help="with --write, write them to stats_dir/<config>/stats instead (config : dir of the metadata)")
+parser.add_argument("--validate", action="store_true",
+                    help="compare the achieved overlap of every config with its target ratio")
+parser.add_argument("--ovr_ratio", type=float, default=None,
+                    help="target ratio, by default taken from the config dir name (sparse_2_0.4 -> 0.4)")
+parser.add_argument("--tolerance", type=float, default=0.05,
+                    help="a transition is on target when its overlap ratio is within this of the intended one")
+parser.add_argument("--max_deviation", type=float, default=None,
+                    help="with --validate exit with an error if the mean abs deviation of a config is above this")
+parser.add_argument("--out_json", type=str, default="", help="write the validation report of all configs here")
+
+
+def find_metadata(paths):
+    found = []
+    for path in paths:
+        if os.path.isfile(path) or is_columnar(path):
+            found.append(path)
+            continue
+        names = ["metadata.json", "metadata.jsonl", "metadata.cols"]
+        candidates = [os.path.join(path, x) for x in names]
+        if not any(os.path.exists(x) for x in candidates):
+            candidates = sorted(x for name in names for x in glob.glob(os.path.join(path, "*", name)))
+        found.extend(x for x in candidates if os.path.exists(x))
+    if not found:
+        raise SystemExit("No metadata found in {}".format(paths))
+    return found
+
+
+def stats_path(path, stats_dir=""):
+    config_dir = os.path.dirname(os.path.abspath(path))
+    if stats_dir:
+        return os.path.join(stats_dir, os.path.basename(config_dir), "stats")
+    return os.path.join(config_dir, "stats")
+
+
+def target_ratio(path):
+    # sparse_2_0.4/metadata.json -> 0.4, None when the config dir name does not end with a ratio
+    try:
+        return float(Path(path).parent.name.rsplit("_", 1)[-1])
+    except ValueError:
+        return None
+
+
+def main(args):
+    report = {}
+    t0 = time.perf_counter()
+    files = find_metadata(args.metadata)
+    for path in files:
+        table = SegmentTable(load_metadata(path))
+        if args.write:
+            stats_dir = stats_path(path, args.stats_dir)
+            os.makedirs(stats_dir, exist_ok=True)
+            for name, stats in [("overlaps.json", overlap_stats(table, args.frame_rate)),
+                                ("speakers.json", speaker_stats(table))]:
+                with open(os.path.join(stats_dir, name), "w") as f:
+                    json.dump(stats, f, indent=4)
+        if args.validate:
+            ratio = args.ovr_ratio if args.ovr_ratio is not None else target_ratio(path)
+            if ratio is None:
+                print("{} : no target ratio, use --ovr_ratio".format(path))
+                continue
+            report[path] = validate(table, ratio, args.tolerance, args.frame_rate)
+    elapsed = time.perf_counter() - t0
+
+    if args.validate:
+        print("{:<50} {:>6} {:>9} {:>9} {:>9} {:>9} {:>10}".format(
+            "metadata", "target", "achieved", "intended", "mean dev", "on target", "overlapped"))
+        for path, r in report.items():
+            print("{:<50} {:>6g} {:>9.3f} {:>9.3f} {:>9.3f} {:>8.1f}% {:>9.1f}%".format(
+                path[-50:], r["ovr_ratio"], r["achieved_mean"], r["intended_mean"], r["mean_abs_deviation"],
+                100 * r["within_tolerance"], 100 * r["overlapped_speech"]))
+        if args.out_json:
+            with open(args.out_json, "w") as f:
+                json.dump(report, f, indent=4)
+    print("{} metadata files in {:.2f} s".format(len(files), elapsed))
+
+    if args.validate and args.max_deviation is not None:
+        bad = [path for path, r in report.items() if r["mean_abs_deviation"] > args.max_deviation]
+        if bad:
+            raise SystemExit("{} configs deviate more than {} from their target : {}".format(
+                len(bad), args.max_deviation, bad))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
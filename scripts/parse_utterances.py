@@ -9,13 +9,20 @@ parser.add_argument("librispeech_dir")
 parser.add_argument("textgrid_dir")
 parser.add_argument("out_file")
 parser.add_argument("--merge_shorter", type=float, default=0.15)
+parser.add_argument("--jobs", type=int, default=1, help="number of worker processes")
+parser.add_argument("--cache_file", type=str, default=None,
+                    help="per file results cache, default in ~/.cache/sparselibrimix, empty string disables it")
 
 
 
-if __name__ == "__main__":
-    args = parser.parse_args()
+def main(args):
     os.makedirs(Path(args.out_file).parent, exist_ok=True)
-    utterances = build_utterance_list(args.librispeech_dir, args.textgrid_dir, merge_shorter=args.merge_shorter)
+    utterances = build_utterance_list(args.librispeech_dir, args.textgrid_dir, merge_shorter=args.merge_shorter,
+                                      jobs=args.jobs, cache_file=args.cache_file)
 
     with open(args.out_file, "w") as f:
         json.dump(utterances, f, indent=4)
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
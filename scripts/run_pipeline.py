@@ -0,0 +1,130 @@
+import argparse
+import os
+import parse_utterances
+import generate_metadata_no_overlap
+import generate_overlap_sweep
+import make_mixtures_multi
+import metadata_stats
+from utils.manifest_utils import MANIFEST_NAME
+from utils.shard_utils import INDEX_NAME
+from utils.overlap_utils import format_ratio
+from utils.parallel_utils import SharedPool, set_shared_pool
+from utils.stage_utils import Stage, StageRunner
+
+STAGES = ["parse", "base", "overlap", "render", "stats"]
+
+parser = argparse.ArgumentParser("Whole SparseLibriMix pipeline in one process, stages whose inputs and parameters "
+                                 "did not change since their last run are skipped")
+parser.add_argument("librispeech_dir")
+parser.add_argument("out_dir", help="mixtures are written to out_dir/<config>/wav<rate>")
+parser.add_argument("--noise_dir", type=str, default="")
+parser.add_argument("--metadata_dir", type=str, default="",
+                    help="default the shipped metadata, or out_dir/metadata when generating it")
+parser.add_argument("--textgrid_dir", type=str, default="",
+                    help="LibriSpeech alignments : generate the metadata (parse, base and overlap stages) instead "
+                         "of using the shipped one")
+parser.add_argument("--n_speakers", type=int, nargs="+", default=[2, 3])
+parser.add_argument("--ovr_ratios", type=float, nargs="+", default=[0.2, 0.4, 0.6, 0.8, 1.0])
+parser.add_argument("--rates", type=int, nargs="+", default=[8000, 16000])
+parser.add_argument("--n_mixtures", type=int, default=500, help="mixtures per config when generating metadata")
+parser.add_argument("--maxlength", type=int, default=15)
+parser.add_argument("--random_seed", type=int, default=777)
+parser.add_argument("--rng", type=str, default="counter", choices=["legacy", "counter"],
+                    help="see generate_metadata_no_overlap.py, counter allows --jobs for the base stage")
+parser.add_argument("--format", type=str, default="json", choices=["json", "jsonl"],
+                    help="format of the generated metadata, jsonl streams mixtures to disk as they are generated "
+                         "(train sized sets)")
+parser.add_argument("--dtype", type=str, default="float64", choices=["float64", "float32"])
+parser.add_argument("--subtype", type=str, default="PCM_16", choices=["PCM_16", "FLOAT"])
+parser.add_argument("--output_format", type=str, default="wav", choices=["wav", "shard"])
+parser.add_argument("--cache_dir", type=str, default="",
+                    help="persistent cache of decoded, resampled and normalized segments for the render stage")
+parser.add_argument("--jobs", type=int, default=1,
+                    help="worker processes, started once and shared by all the stages (render included)")
+parser.add_argument("--force", type=str, nargs="*", default=[], choices=STAGES + ["all"],
+                    help="run these stages even if up to date")
+parser.add_argument("--dry_run", action="store_true", help="only print which stages would run")
+
+
+def call(module, *argv):
+    # runs a script in this process, with the arguments it would get on the command line
+    return lambda: module.main(module.parser.parse_args([str(x) for x in argv]))
+
+
+def build_stages(args, metadata_dir):
+    configs = ["sparse_{}_{}".format(n, format_ratio(r)) for n in args.n_speakers for r in [0] + args.ovr_ratios]
+    name = "metadata.jsonl" if args.textgrid_dir and args.format == "jsonl" else "metadata.json"
+    config_metadata = [os.path.join(metadata_dir, c, name) for c in configs]
+    base_metadata = [os.path.join(metadata_dir, "sparse_{}_0".format(n), name) for n in args.n_speakers]
+    stages = []
+
+    if args.textgrid_dir:
+        utterances = os.path.join(metadata_dir, "utterances.json")
+        stages.append(Stage("parse", call(parse_utterances, args.librispeech_dir, args.textgrid_dir, utterances,
+                                          "--jobs", args.jobs),
+                            inputs=[args.librispeech_dir, args.textgrid_dir], outputs=[utterances]))
+        params = {"n_mixtures": args.n_mixtures, "maxlength": args.maxlength, "random_seed": args.random_seed,
+                  "rng": args.rng}
+        jobs = args.jobs if args.rng == "counter" else 1
+        base = [call(generate_metadata_no_overlap, utterances, args.noise_dir, out_json, "--n_speakers", n,
+                     *[x for k, v in params.items() for x in ["--" + k, v]], "--jobs", jobs)
+                for n, out_json in zip(args.n_speakers, base_metadata)]
+        stages.append(Stage("base", lambda: [run() for run in base], inputs=[utterances, args.noise_dir],
+                            outputs=base_metadata, params=dict(params, n_speakers=args.n_speakers)))
+        params = {"ovr_ratios": args.ovr_ratios, "random_seed": args.random_seed, "format": args.format}
+        stages.append(Stage("overlap", call(generate_overlap_sweep, metadata_dir, "--no_ov_metadata", *base_metadata,
+                                            "--ovr_ratios", *args.ovr_ratios, "--random_seed", args.random_seed,
+                                            "--format", args.format),
+                            inputs=base_metadata, outputs=[x for x in config_metadata if x not in base_metadata],
+                            params=params))
+
+    params = {"rates": args.rates, "configs": configs, "dtype": args.dtype, "subtype": args.subtype,
+              "output_format": args.output_format}
+    render_args = [metadata_dir, args.librispeech_dir, args.out_dir, "--rates", *args.rates, "--configs", *configs,
+                   "--dtype", args.dtype, "--subtype", args.subtype, "--output_format", args.output_format,
+                   "--jobs", args.jobs]
+    if args.output_format == "wav":
+        # mixtures already rendered and unchanged are skipped also when the stage reruns
+        render_args.append("--resume")
+    if args.noise_dir:
+        render_args += ["--noise_dir", args.noise_dir]
+    if args.cache_dir:
+        render_args += ["--cache_dir", args.cache_dir]
+    stages.append(Stage("render", call(make_mixtures_multi, *render_args),
+                        inputs=config_metadata + [args.librispeech_dir] + ([args.noise_dir] if args.noise_dir else []),
+                        outputs=[os.path.join(args.out_dir, c, "wav{}".format(r),
+                                              MANIFEST_NAME if args.output_format == "wav" else INDEX_NAME)
+                                 for c in configs for r in args.rates],
+                        params=params))
+
+    # next to the mixtures, the metadata dir may be the shipped (git tracked) one
+    stages.append(Stage("stats", call(metadata_stats, *config_metadata, "--write", "--stats_dir", args.out_dir),
+                        inputs=config_metadata,
+                        outputs=[os.path.join(args.out_dir, c, "stats", name) for c in configs
+                                 for name in ["overlaps.json", "speakers.json"]]))
+    return stages
+
+
+def main(args):
+    if args.textgrid_dir and not args.noise_dir:
+        raise SystemExit("Generating the metadata needs --noise_dir")
+    metadata_dir = args.metadata_dir or (os.path.join(args.out_dir, "metadata") if args.textgrid_dir else "metadata")
+
+    runner = StageRunner(os.path.join(args.out_dir, ".stages"), args.force, args.dry_run)
+    pool = SharedPool(args.jobs) if args.jobs > 1 and not args.dry_run else None
+    set_shared_pool(pool)
+    try:
+        ran = [stage.name for stage in build_stages(args, metadata_dir) if runner.run(stage)]
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        set_shared_pool(None)
+    if pool is not None:
+        pool.close()
+    print("Stages run : {}".format(", ".join(ran) if ran else "none, everything is up to date"))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+import soundfile as sf
+
+AUDIO_EXTENSIONS = (".wav", ".flac")
+
+
+def default_cache_file(root, kind):
+    # one file per root and kind, kept out of the (possibly read only) dataset dir and of the cwd
+    cache_dir = os.environ.get("SPARSELIBRIMIX_CACHE",
+                               os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                                            "sparselibrimix"))
+    root = os.path.abspath(root)
+    digest = hashlib.sha1(root.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, "{}_{}_{}.json".format(kind, Path(root).name, digest))
+
+
+def default_index_path(root):
+    return default_cache_file(root, "audio_index")
+
+
+def probe(path, st=None):
+    st = st or os.stat(path)
+    info = sf.info(path)
+    return {"frames": info.frames, "samplerate": info.samplerate, "channels": info.channels,
+            "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+class AudioIndex:
+    """Persistent index of audio headers (frames, samplerate, channels) for all files under root.
+
+    Entries are keyed by path relative to root and are valid as long as size and mtime do not change,
+    info() re-probes a single stale file, refresh() updates the whole tree by stat only.
+    """
+    def __init__(self, root, index_file=None):
+        self.root = os.path.abspath(root)
+        self.index_file = index_file or default_index_path(root)
+        self.entries = {}
+        self.dirty = False
+        if os.path.isfile(self.index_file):
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+            if index.get("root") == self.root:
+                self.entries = index["entries"]
+
+    def _rel(self, path):
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        if rel.startswith(".."):
+            raise ValueError("{} is not under {}".format(path, self.root))
+        return rel
+
+    def info(self, path):
+        rel = self._rel(path)
+        path = os.path.join(self.root, rel)
+        st = os.stat(path)
+        entry = self.entries.get(rel)
+        if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime_ns:
+            entry = probe(path, st)
+            self.entries[rel] = entry
+            self.dirty = True
+        return entry
+
+    def frames(self, path):
+        return self.info(path)["frames"]
+
+    def samplerate(self, path):
+        return self.info(path)["samplerate"]
+
+    def refresh(self, extensions=AUDIO_EXTENSIONS):
+        # walks root, probes only new or modified files and drops removed ones
+        seen = set()
+        n_probed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(extensions):
+                    continue
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, self.root)
+                seen.add(rel)
+                st = os.stat(path)
+                entry = self.entries.get(rel)
+                if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime_ns:
+                    self.entries[rel] = probe(path, st)
+                    self.dirty = True
+                    n_probed += 1
+        removed = [x for x in self.entries.keys() if x not in seen]
+        for rel in removed:
+            del self.entries[rel]
+        self.dirty = self.dirty or bool(removed)
+        return n_probed, len(removed)
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp = self.index_file + ".{}.tmp".format(os.getpid())
+        with open(tmp, "w") as f:
+            json.dump({"root": self.root, "entries": self.entries}, f)
+        os.replace(tmp, self.index_file)
+        self.dirty = False
+
+
+class AudioIndexes:
+    # dispatches header queries to the index of the root containing each path
+    def __init__(self, roots):
+        self.indexes = [AudioIndex(r) for r in roots if r]
+
+    def info(self, path):
+        path = os.path.abspath(path)
+        for index in self.indexes:
+            if path.startswith(index.root + os.sep):
+                return index.info(path)
+        return probe(path)
+
+    def samplerate(self, path):
+        return self.info(path)["samplerate"]
+
+    def save(self):
+        for index in self.indexes:
+            index.save()
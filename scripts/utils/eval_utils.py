@@ -0,0 +1,111 @@
+import itertools
+import numpy as np
+from .pipeline_utils import prefetch as prefetch_iter
+
+# Permutation invariant SI-SDR / SI-SDRi for batches of mixtures. Signals of a batch are zero padded to a common
+# length, zero mean and projections are computed from sums over the true lengths so that padding changes nothing:
+# all (estimate, reference) pairs of all mixtures come from one einsum, all permutations from one gather.
+
+EPS = 1e-8
+
+
+def source_names(streams):
+    # s1, s2 ... in order, from a dict of streams or a list of names
+    return sorted([s for s in streams if s[0] == "s" and s[1:].isdigit()], key=lambda s: int(s[1:]))
+
+
+def pad_batch(signals):
+    # list of (n_sources, T_b) arrays -> (B, n_sources, T) zero padded float64 array and the lengths T_b
+    lengths = np.array([x.shape[-1] for x in signals], dtype=np.int64)
+    out = np.zeros((len(signals), signals[0].shape[0], lengths.max(initial=0)))
+    for b, x in enumerate(signals):
+        out[b, :, :x.shape[-1]] = x
+    return out, lengths
+
+
+def pairwise_si_sdr(est, ref, lengths):
+    # (B, N, N) SI-SDR in dB of estimate i against reference j, est and ref are (B, N, T) zero padded
+    n = lengths[:, None, None].astype(np.float64)
+    s_e, s_r = est.sum(-1)[:, :, None], ref.sum(-1)[:, None, :]
+    dot = np.einsum("bit,bjt->bij", est, ref) - s_e * s_r / n
+    e_energy = np.einsum("bit,bit->bi", est, est)[:, :, None] - s_e ** 2 / n
+    r_energy = np.einsum("bjt,bjt->bj", ref, ref)[:, None, :] - s_r ** 2 / n
+    # ||alpha r||^2 and ||e - alpha r||^2 with alpha = <e, r> / ||r||^2
+    target = dot ** 2 / (r_energy + EPS)
+    residual = np.maximum(e_energy - target, 0)
+    return 10 * np.log10((target + EPS) / (residual + EPS))
+
+
+def si_sdr(est, ref, lengths):
+    # (B, N) SI-SDR of est[b, i] against ref[b, i]
+    return np.diagonal(pairwise_si_sdr(est, ref, lengths), axis1=1, axis2=2).copy()
+
+
+def pit_si_sdr(est, ref, lengths):
+    # best permutation of the estimates : (B, N) SI-SDR in reference order and (B, N) estimate index of each
+    # reference, the permutation maximizing the mean SI-SDR
+    pairwise = pairwise_si_sdr(est, ref, lengths)
+    n = est.shape[1]
+    perms = np.array(list(itertools.permutations(range(n))), dtype=np.int64) # (P, N)
+    scores = pairwise[:, perms, np.arange(n)] # (B, P, N)
+    best = scores.mean(-1).argmax(-1)
+    return scores[np.arange(len(est)), best], perms[best]
+
+
+def score_batch(estimates, references, mixtures):
+    # estimates and references : lists of (N, T) arrays, mixtures : list of (T,) arrays. Signals of a mixture
+    # are cut to their shortest length. Returns (si_sdr, si_sdri, perm), each (B, N) in reference order
+    cut = [min(e.shape[-1], r.shape[-1], len(m)) for e, r, m in zip(estimates, references, mixtures)]
+    est, lengths = pad_batch([e[:, :t] for e, t in zip(estimates, cut)])
+    ref, _ = pad_batch([r[:, :t] for r, t in zip(references, cut)])
+    mix, _ = pad_batch([np.broadcast_to(m[:t], (r.shape[0], t)) for m, r, t in zip(mixtures, references, cut)])
+    sdr, perm = pit_si_sdr(est, ref, lengths)
+    return sdr, sdr - si_sdr(mix, ref, lengths), perm
+
+
+def batched(items, size):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iterate_scores(items, load, batch_size=16, prefetch=8, workers=4):
+    """Yields one record per item, in order, while the next items are loaded by a thread pool.
+
+    load(item) returns (name, estimates, references, mixture) with (N, T) estimates and references, records
+    are dicts with mixture_name, si_sdr, si_sdri (lists in reference order, dB) and perm.
+    """
+    for batch in batched(prefetch_iter(load, items, prefetch, workers), batch_size):
+        names, estimates, references, mixtures = zip(*batch)
+        sdr, sdri, perm = score_batch(estimates, references, mixtures)
+        for b, name in enumerate(names):
+            yield {"mixture_name": name, "si_sdr": sdr[b].tolist(), "si_sdri": sdri[b].tolist(),
+                   "perm": perm[b].tolist()}
+
+
+def summarize(records):
+    # mean / median over mixtures and sources of the per mixture records
+    sdr = np.array([x for r in records for x in r["si_sdr"]])
+    sdri = np.array([x for r in records for x in r["si_sdri"]])
+    if not len(sdr):
+        return {"mixtures": 0}
+    return {"mixtures": len(records), "si_sdr": float(sdr.mean()), "si_sdri": float(sdri.mean()),
+            "si_sdr_median": float(np.median(sdr)), "si_sdri_median": float(np.median(sdri))}
+
+
+def evaluate_model(generator, separate, mixture="mix_clean", batch_size=16, prefetch=0):
+    """Scores separate(mixture_signal) -> (N, T) estimates against references rendered in memory.
+
+    generator is a mixture_generator.MixtureGenerator, nothing is read from or written to disk besides the
+    sources. Yields the same records as iterate_scores.
+    """
+    def load(item):
+        name, streams = item
+        sources = source_names(streams)
+        return name, np.asarray(separate(streams[mixture])), np.stack([streams[s] for s in sources]), \
+            streams[mixture]
+
+    return iterate_scores(generator.iterate(prefetch), load, batch_size, prefetch=0)
@@ -1,7 +1,10 @@
 import os
 import glob
+import json
 from pathlib import Path
-from .textgrid_utils import build_hashtable_textgrid, get_textgrid_sa
+from .textgrid_utils import build_hashtable_textgrid, read_textgrid_words, merge_word_alignment
+from .audio_index import default_cache_file
+from .parallel_utils import imap_jobs
 import soundfile as sf
 import numpy as np
 
@@ -51,7 +54,78 @@ def estimate_snr(speech, file):
     return speech_lvl / (noise_lvl + 1e-8)
 
 
-def build_utterance_list(librispeech_dir, textgrid_dir, merge_shorter=0.15, fs=16000):
+def analyse_utterance(files):
+    # everything build_utterance_list needs from a file which does not depend on merge_shorter or on the
+    # SNR threshold: raw word alignment and cumulative energy of the zero mean audio at every word boundary
+    flac, textgrid = files
+    words, start_time, end_time = read_textgrid_words(textgrid)
+    audio, fs = sf.read(flac)
+    audio = audio - np.mean(audio)
+    bounds = [int(x*fs) for x in start_time] + [int(x*fs) for x in end_time] + [0, len(audio)]
+    bounds = np.unique(np.clip(bounds, 0, len(audio)))
+    energy = np.concatenate(([0.], np.cumsum(audio**2)))[bounds]
+    return {"words": list(words), "start": list(start_time), "end": list(end_time), "fs": fs,
+            "n_samples": len(audio), "bounds": bounds.tolist(), "energy": energy.tolist()}
+
+
+def estimate_snr_from_energy(speech, analysis):
+    # same as estimate_snr but from the energies stored by analyse_utterance
+    fs, n = analysis["fs"], analysis["n_samples"]
+    energy = dict(zip(analysis["bounds"], analysis["energy"]))
+
+    def get_energy(s, e):
+        s, e = min(max(s, 0), n), min(max(e, 0), n)
+        return max(energy[e] - energy[s], 0.) if e > s else 0.
+
+    speech_lvl = [get_energy(int(x[0]*fs), int(x[-1]*fs)) for x in speech]
+    noise_lvl = [get_energy(0, int(speech[0][0]*fs))]
+    for i in range(1, len(speech)):
+        noise_lvl.append(get_energy(int(speech[i-1][-1]*fs), int(speech[i][0]*fs)))
+    noise_lvl.append(get_energy(int(speech[-1][-1]*fs), n))
+
+    return min(speech_lvl) / (min(noise_lvl) + 1e-8) # we take min to avoid breathing
+
+
+class UtteranceCache:
+    # per file results of analyse_utterance, valid while mtime and size of both flac and TextGrid are unchanged
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.dirty = False
+        if cache_file and os.path.isfile(cache_file):
+            with open(cache_file, "r") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def stamp(files):
+        return [[os.stat(f).st_mtime_ns, os.stat(f).st_size] for f in files]
+
+    def get(self, files):
+        entry = self.entries.get(os.path.abspath(files[0]))
+        if entry is not None and entry["textgrid"] == os.path.abspath(files[1]) and \
+                entry["stamp"] == self.stamp(files):
+            return entry["analysis"]
+        return None
+
+    def put(self, files, analysis):
+        self.entries[os.path.abspath(files[0])] = {"textgrid": os.path.abspath(files[1]),
+                                                   "stamp": self.stamp(files), "analysis": analysis}
+        self.dirty = True
+
+    def save(self):
+        if not self.cache_file or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        tmp = self.cache_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.cache_file)
+        self.dirty = False
+
+
+def build_utterance_list(librispeech_dir, textgrid_dir, merge_shorter=0.15, fs=16000, jobs=1, cache_file=None,
+                         snr_threshold=25, max_low_snr=0.1):
+    # cache_file=None uses a cache file in ~/.cache/sparselibrimix, cache_file="" disables the cache
 
     hashgrid = build_hashtable_textgrid(textgrid_dir)
     audiofiles = glob.glob(os.path.join(librispeech_dir, "**/*.flac"), recursive=True)
@@ -61,14 +135,35 @@ def build_utterance_list(librispeech_dir, textgrid_dir, merge_shorter=0.15, fs=1
 
     snrs = []
 
+    valid = []
     for f in audiofiles:
-
         filename = Path(f).stem
         if filename not in hashgrid.keys():
             print("Missing Alignment file for : {}".format(f))
             tot_missing += 1
             continue
-        speech, words = get_textgrid_sa(hashgrid[filename], merge_shorter)
+        valid.append((f, hashgrid[filename]))
+
+    # TextGrid parsing and audio decoding are done once per file (in parallel), results are cached
+    # so that changing merge_shorter or the SNR threshold only reruns what follows
+    cache = UtteranceCache(default_cache_file(librispeech_dir, "utterances") if cache_file is None else cache_file)
+    analyses = {}
+    todo = []
+    for files in valid:
+        analysis = cache.get(files)
+        if analysis is None:
+            todo.append(files)
+        else:
+            analyses[files[0]] = analysis
+    for files, analysis in zip(todo, imap_jobs(analyse_utterance, todo, jobs, chunksize=8)):
+        analyses[files[0]] = analysis
+        cache.put(files, analysis)
+    cache.save()
+    print("Analysed {} files, {} from cache".format(len(valid), len(valid) - len(todo)))
+
+    for f, textgrid in valid:
+        analysis = analyses[f]
+        speech, words = merge_word_alignment(analysis["words"], analysis["start"], analysis["end"], merge_shorter)
 
         spk_id = Path(f).parent.parent.stem
 
@@ -77,14 +172,14 @@ def build_utterance_list(librispeech_dir, textgrid_dir, merge_shorter=0.15, fs=1
         if not speech:
             raise EnvironmentError("something is wrong with alignments or parsing, all librispeech files have speech")
 
-        snr = estimate_snr(speech, f)
+        snr = estimate_snr_from_energy(speech, analysis)
         snrs.append([f, snr])
 
         for i in range(len(speech)):
             start, stop = speech[i]
             #start = #int(start*fs)
             #stop = int(stop*fs)
-            tmp = {"textgrid": hashgrid[filename], "file": f, "start": start, "stop": stop, "words": words[i],
+            tmp = {"textgrid": textgrid, "file": f, "start": start, "stop": stop, "words": words[i],
                    "spk_id": spk_id, "chapter_id": Path(f).parent.stem, "utt_id": Path(f).stem}
             sub_utterances.append(tmp)
 
@@ -104,7 +199,7 @@ def build_utterance_list(librispeech_dir, textgrid_dir, merge_shorter=0.15, fs=1
         if chapter not in chapters.keys():
             chapters[chapter] = [0, 0]
         chapters[chapter][0]  += 1
-        if snr < 25: # tuned manually
+        if snr < snr_threshold: # tuned manually
             chapters[chapter][-1] += 1
 
     # normalize
@@ -116,7 +211,7 @@ def build_utterance_list(librispeech_dir, textgrid_dir, merge_shorter=0.15, fs=1
     for spk in utterances.keys():
         new[spk] = []
         for utt in utterances[spk]:
-            if chapters[utt[0]["chapter_id"]] >= 0.1:
+            if chapters[utt[0]["chapter_id"]] >= max_low_snr:
                 continue
             else:
                 new[spk].append(utt)
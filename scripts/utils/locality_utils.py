@@ -0,0 +1,129 @@
+import time
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+import soundfile as sf
+from .mixture_utils import mixture_paths, mixture_utterances
+from .profiling_utils import get_timer
+from .wav_utils import read_wav_window, wav_header
+
+
+class DecodedFileCache:
+    """LRU of fully decoded audio files, segments are sliced from them.
+
+    read(utt, path) returns the same (audio, fs) as mixture_utils.read_utterance, but each file is opened
+    and decoded once while it stays in the cache instead of one open and seek per segment (FLAC has to
+    decode from the previous seek point). max_bytes bounds the decoded audio kept in memory, files are
+    decoded to dtype (float32 halves it).
+    """
+    def __init__(self, max_bytes=2 ** 30, dtype=np.float64):
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.files = OrderedDict()
+        self.size = 0
+        self.n_reads = 0            # segments requested
+        self.n_opened = 0           # files opened and decoded
+        self.open_seconds = 0.      # wall time spent opening files
+        self.decode_seconds = 0.    # wall time spent decoding
+        self.decoded_frames = 0
+        self.requested_frames = 0
+        self.lock = threading.Lock() # reads may come from prefetch threads
+
+    def _decode(self, path):
+        with self.lock:
+            return self._decode_locked(path)
+
+    def _decode_locked(self, path):
+        entry = self.files.get(path)
+        if entry is not None:
+            self.files.move_to_end(path)
+            return entry
+        with get_timer().phase("read"):
+            t0 = time.perf_counter()
+            with sf.SoundFile(path) as f:
+                t1 = time.perf_counter()
+                entry = f.read(dtype=self.dtype, always_2d=True), f.samplerate
+            self.open_seconds += t1 - t0
+            self.decode_seconds += time.perf_counter() - t1
+        self.n_opened += 1
+        self.decoded_frames += len(entry[0])
+        self.files[path] = entry
+        self.size += entry[0].nbytes
+        while self.size > self.max_bytes and len(self.files) > 1:
+            _, (old, _) = self.files.popitem(last=False)
+            self.size -= old.nbytes
+        return entry
+
+    def read(self, utt, path):
+        if path.lower().endswith(".wav"):
+            # memory mapped wavs are sliced directly, no need to decode and keep the whole file
+            fs = wav_samplerate(path)
+            if fs is not None:
+                out = read_wav_window(path, int(utt["orig_start"]*fs), int(utt["orig_stop"]*fs), utt.get("channel"),
+                                      self.dtype)
+                if out is not None:
+                    audio, fs = out
+                    return audio - np.mean(audio), fs
+        audio, fs = self._decode(path)
+        audio = audio[int(utt["orig_start"]*fs):int(utt["orig_stop"]*fs)]
+        with self.lock:
+            self.n_reads += 1
+            self.requested_frames += len(audio)
+        # same channel selection and zero mean as read_utterance
+        audio = audio[:, utt["channel"]] if audio.shape[1] > 1 else audio[:, 0]
+        return audio - np.mean(audio), fs
+
+    def read_mixture(self, mix, librispeech_dir, noise_dir):
+        return [self.read(utt, path) for _, utt, path in mixture_utterances(mix, librispeech_dir, noise_dir)]
+
+    def stats(self):
+        # counters, they can be summed over processes before estimated_saved_seconds
+        return {"segments": self.n_reads, "files_opened": self.n_opened, "open_seconds": self.open_seconds,
+                "decode_seconds": self.decode_seconds, "decoded_frames": self.decoded_frames,
+                "requested_frames": self.requested_frames}
+
+
+def estimated_saved_seconds(stats):
+    # time saved compared to one open and seeking read per segment, estimated from the measured cost of an
+    # open and of a decoded frame. Decoding whole files can cost more frames than it saves (negative part),
+    # FLAC seeks are not counted.
+    per_open = stats["open_seconds"] / stats["files_opened"] if stats["files_opened"] else 0.
+    per_frame = stats["decode_seconds"] / stats["decoded_frames"] if stats["decoded_frames"] else 0.
+    return (stats["segments"] - stats["files_opened"]) * per_open + \
+           (stats["requested_frames"] - stats["decoded_frames"]) * per_frame
+
+
+def wav_samplerate(path):
+    header = wav_header(path)
+    return header["samplerate"] if header is not None else None
+
+
+def locality_order(metadata, librispeech_dir, noise_dir):
+    # order of the mixtures such that mixtures sharing source files are rendered close to each other
+    return shared_files_order([set(mixture_paths(mix, librispeech_dir, noise_dir)) for mix in metadata])
+
+
+def shared_files_order(files):
+    # files[i] is the set of files item i reads. Breadth first traversal of the graph linking items that read
+    # the same file, starting from the first item and jumping to the next unvisited one when a component is done
+    users = {}
+    for i, fs in enumerate(files):
+        for f in fs:
+            users.setdefault(f, []).append(i)
+
+    order = []
+    seen = np.zeros(len(files), dtype=bool)
+    for start in range(len(files)):
+        if seen[start]:
+            continue
+        seen[start] = True
+        todo = deque([start])
+        while todo:
+            i = todo.popleft()
+            order.append(i)
+            for f in sorted(files[i]):
+                for j in users[f]:
+                    if not seen[j]:
+                        seen[j] = True
+                        todo.append(j)
+    return order
@@ -0,0 +1,78 @@
+import functools
+import numpy as np
+from scipy.signal import lfilter
+from pyloudnorm.iirfilter import IIRfilter
+
+# Integrated loudness (ITU-R BS.1770-4) of mono signals, computed as pyloudnorm.Meter(rate, block_size=0.1)
+# does but for many signals at once: K-weighting coefficients are built once per rate, block energies come
+# from cumulative sums instead of one np.sum per block and gating is done for all blocks of all signals
+# together. Gains agree with pyloudnorm within GAIN_TOLERANCE_DB (checked by tests/test_loudness.py).
+# float32 signals are filtered in float32 (block energies are still accumulated in float64) and stay float32.
+
+GAIN_TOLERANCE_DB = 1e-6
+ABS_THRESHOLD = -70.0
+
+
+@functools.lru_cache(maxsize=None)
+def k_weighting(rate, dtype="float64"):
+    # list of (b, a, passband_gain) : BS.1770 high shelf then high pass, built with the public IIRfilter and
+    # the parameters of pyloudnorm.Meter(filter_class="K-weighting") so that the filters are exactly the same.
+    # Coefficients are cast to the dtype of the filtered signal, lfilter would upcast it otherwise
+    filters = [IIRfilter(4.0, 1 / np.sqrt(2), 1500.0, rate, "high_shelf"), IIRfilter(0.0, 0.5, 38.0, rate, "high_pass")]
+    return [(np.asarray(f.b, dtype=dtype), np.asarray(f.a, dtype=dtype), f.passband_gain) for f in filters]
+
+
+def block_bounds(n_samples, rate, block_size=0.1, overlap=0.75):
+    # lower and upper sample of every gating block, same rounding as pyloudnorm
+    step = 1.0 - overlap
+    T = n_samples / rate
+    n_blocks = int(np.round(((T - block_size) / (block_size * step)))+1)
+    j = np.arange(0, n_blocks)
+    lower = (block_size * (j * step) * rate).astype(np.int64)
+    upper = (block_size * (j * step + 1) * rate).astype(np.int64)
+    return np.minimum(lower, n_samples), np.minimum(upper, n_samples)
+
+
+def integrated_loudness(signals, rate, block_size=0.1, overlap=0.75):
+    # returns the integrated loudness in LUFS of each 1-D signal in signals (float64 or float32)
+    if len(signals) == 0:
+        return np.zeros(0)
+    lengths = np.array([len(x) for x in signals], dtype=np.int64)
+    if np.any(lengths < block_size * rate):
+        raise ValueError("Audio must have length greater than the block size.")
+
+    # mean square of every block of every signal, flattened with the signal index in seg
+    seg, z = [], []
+    for i, x in enumerate(signals):
+        for b, a, passband_gain in k_weighting(rate, np.result_type(x.dtype, np.float32).name):
+            x = passband_gain * lfilter(b, a, x)
+        energy = np.zeros(len(x) + 1)
+        np.cumsum(np.square(x), out=energy[1:], dtype=np.float64)
+        lower, upper = block_bounds(len(x), rate, block_size, overlap)
+        z.append((1.0 / (block_size * rate)) * (energy[upper] - energy[lower]))
+        seg.append(np.full(len(lower), i))
+    seg = np.concatenate(seg)
+    z = np.maximum(np.concatenate(z), 0) # cumsum differences can be slightly negative on silence
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l_j = -0.691 + 10.0 * np.log10(z)
+        # absolute gate
+        gated = l_j >= ABS_THRESHOLD
+        z_avg = np.bincount(seg, z * gated, len(signals)) / np.bincount(seg, gated, len(signals))
+        # relative gate
+        gamma_r = -0.691 + 10.0 * np.log10(z_avg) - 10.0
+        gated = (l_j > gamma_r[seg]) & (l_j > ABS_THRESHOLD)
+        z_avg = np.nan_to_num(np.bincount(seg, z * gated, len(signals)) / np.bincount(seg, gated, len(signals)))
+        return -0.691 + 10.0 * np.log10(z_avg)
+
+
+def loudness_gains(signals, rate, targets):
+    # linear gains bringing each signal to its target loudness, as pyloudnorm.normalize.loudness
+    delta = np.asarray(targets, dtype=np.float64) - integrated_loudness(signals, rate)
+    return np.power(10.0, delta / 20.0)
+
+
+def normalize(signals, rate, targets):
+    # gains are cast so that float32 signals stay float32
+    return [x * x.dtype.type(gain) for x, gain in zip(signals, loudness_gains(signals, rate, targets))]
+
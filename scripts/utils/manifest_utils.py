@@ -0,0 +1,90 @@
+import os
+import re
+import json
+import hashlib
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+WAV_TMP = re.compile(r"^.+\.wav\.\d+\.tmp$") # <name>.wav.<pid>.tmp, see mixture_utils.write_wav
+
+
+def mixture_hash(mix):
+    # hash of a metadata entry, independent of key order and of the metadata format it was loaded from
+    return hashlib.sha1(json.dumps(mix, sort_keys=True).encode()).hexdigest()
+
+
+def file_sha1(path, chunk_size=2 ** 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def render_params(rate, librispeech_dir, noise_dir, dtype, subtype="PCM_16"):
+    # everything besides the metadata entry that changes the output files
+    return {"rate": rate, "librispeech_dir": os.path.abspath(librispeech_dir),
+            "noise_dir": os.path.abspath(noise_dir) if noise_dir else "", "dtype": dtype, "subtype": subtype}
+
+
+class Manifest:
+    """Record of the mixtures rendered in an output dir, stored in out_dir/manifest.json.
+
+    Each entry holds the hash of the mixture metadata and sha1 and size of every output file. Entries are
+    only valid for the render params they were written with (rate, noise dir ...), a manifest written with
+    other params is discarded.
+    """
+    def __init__(self, out_dir, params):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.params = params
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION and manifest.get("params") == params:
+                self.entries = manifest["entries"]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def file_path(self, name, stream):
+        return os.path.join(self.out_dir, stream, name + ".wav")
+
+    def is_valid(self, mix, verify=False):
+        # output files exist with the recorded size (and checksum if verify) for the same metadata entry
+        entry = self.entries.get(mix["mixture_name"])
+        if entry is None or entry["meta"] != mixture_hash(mix):
+            return False
+        for stream, f in entry["files"].items():
+            path = self.file_path(mix["mixture_name"], stream)
+            if not os.path.isfile(path) or os.path.getsize(path) != f["size"]:
+                return False
+            if verify and file_sha1(path) != f["sha1"]:
+                return False
+        return True
+
+    def clear(self):
+        self.entries = {}
+
+    def record(self, name, meta_hash, files):
+        self.entries[name] = {"meta": meta_hash, "files": files}
+
+    def remove_stale_tmp(self):
+        # temporary files of a killed run, only those written here : <stream>/<name>.wav.<pid>.tmp and
+        # manifest.json.tmp. Other files of out_dir are never touched
+        stale = [self.path + ".tmp"] if os.path.isfile(self.path + ".tmp") else []
+        if os.path.isdir(self.out_dir):
+            for stream in os.scandir(self.out_dir):
+                if stream.is_dir(follow_symlinks=False):
+                    stale.extend(x.path for x in os.scandir(stream.path) if x.is_file() and WAV_TMP.match(x.name))
+        for path in stale:
+            os.remove(path)
+        return len(stale)
+
+    def save(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "params": self.params, "entries": self.entries}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,325 @@
+import os
+import glob
+import json
+from pathlib import Path
+from collections.abc import Sequence
+import numpy as np
+
+# Columnar metadata : a directory with one .npy per column and a meta.json holding the string vocabularies,
+# the key layouts and the value types, so that a metadata list can be restored exactly (same keys, order,
+# int/float types) while mixture i is read in O(1) from memory mapped columns.
+#
+#   offsets.npy       (n_mixtures + 1) first segment of each mixture
+#   layout.npy        (n_mixtures) index in meta["layouts"], keys of the mixture dict in order
+#   seg_key.npy       (n_segments) index in the layout of the list the segment belongs to (s1, s2, noise ...)
+#   seg_schema.npy    (n_segments) index in meta["schemas"], [key, type] of the segment dict in order
+#   <key>.npy         one column per segment key, str are codes in meta["vocabs"][key],
+#                     lists of str are codes plus <key>.offsets.npy
+
+COLUMNAR_VERSION = 1
+META_NAME = "meta.json"
+COLUMNAR_SUFFIX = ".cols"
+JSONL_SUFFIX = ".jsonl" # one mixture per line, written and read as a stream
+
+
+def _value_type(value):
+    if isinstance(value, bool):
+        raise TypeError("bool values are not supported")
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, list) and all(isinstance(x, str) for x in value):
+        return "strlist"
+    raise TypeError("Unsupported metadata value {!r}".format(value))
+
+
+def _encode(values, vocab):
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        codes[i] = vocab.setdefault(v, len(vocab))
+    return codes
+
+
+def save_columnar(metadata, out_dir):
+    layouts, schemas = {}, {}
+    offsets, layout_codes, seg_key, seg_schema = [0], [], [], []
+    columns = {}  # key -> list of values (None when the segment does not have the key)
+    n_segments = 0
+    for mix in metadata:
+        keys = tuple(mix.keys())
+        if "mixture_name" not in keys:
+            raise ValueError("mixture without mixture_name")
+        layout_codes.append(layouts.setdefault(keys, len(layouts)))
+        for k_i, k in enumerate(keys):
+            if k == "mixture_name":
+                continue
+            if not isinstance(mix[k], list):
+                raise TypeError("{} of {} is not a list of segments".format(k, mix["mixture_name"]))
+            for seg in mix[k]:
+                schema = tuple((key, _value_type(v)) for key, v in seg.items())
+                seg_schema.append(schemas.setdefault(schema, len(schemas)))
+                seg_key.append(k_i)
+                for key, v in seg.items():
+                    columns.setdefault(key, [None] * n_segments).append(v)
+                n_segments += 1
+                for key, col in columns.items():
+                    if len(col) < n_segments:
+                        col.append(None)
+        offsets.append(n_segments)
+
+    os.makedirs(out_dir, exist_ok=True)
+    names = [m["mixture_name"] for m in metadata]
+    vocabs, kinds = {}, {}
+    arrays = {"offsets": np.array(offsets, dtype=np.int64), "layout": np.array(layout_codes, dtype=np.int32),
+              "seg_key": np.array(seg_key, dtype=np.int32), "seg_schema": np.array(seg_schema, dtype=np.int32)}
+    for key, col in columns.items():
+        types = {t for schema in schemas for k, t in schema if k == key}
+        if types <= {"int"}:
+            kinds[key] = "int"
+            arrays[key] = np.array([0 if v is None else v for v in col], dtype=np.int64)
+        elif types <= {"int", "float"}:
+            kinds[key] = "float"
+            if any(isinstance(v, int) and abs(v) > 2 ** 53 for v in col):
+                raise ValueError("int values of {} do not fit in a float column".format(key))
+            arrays[key] = np.array([np.nan if v is None else v for v in col], dtype=np.float64)
+        elif types == {"str"}:
+            kinds[key] = "str"
+            vocab = {}
+            arrays[key] = np.where([v is None for v in col], -1, _encode(["" if v is None else v for v in col],
+                                                                         vocab)).astype(np.int32)
+            vocabs[key] = list(vocab.keys())
+        elif types == {"strlist"}:
+            kinds[key] = "strlist"
+            vocab = {}
+            lists = [[] if v is None else v for v in col]
+            arrays[key] = _encode([x for v in lists for x in v], vocab)
+            arrays[key + ".offsets"] = np.cumsum([0] + [len(v) for v in lists]).astype(np.int64)
+            vocabs[key] = list(vocab.keys())
+        else:
+            raise TypeError("Mixed value types {} for {}".format(sorted(types), key))
+
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, name + ".npy"), array)
+    meta = {"version": COLUMNAR_VERSION, "names": names, "kinds": kinds, "vocabs": vocabs,
+            "layouts": [list(x) for x in layouts], "schemas": [[list(x) for x in s] for s in schemas]}
+    tmp = os.path.join(out_dir, META_NAME + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    # meta.json is written last, a directory without it is not valid columnar metadata
+    os.replace(tmp, os.path.join(out_dir, META_NAME))
+
+
+class ColumnarMetadata(Sequence):
+    """Read only list of mixture metadata stored by save_columnar.
+
+    Columns are memory mapped (mmap=True) and each item is built on access, metadata[i] is the same dict
+    json.load would give for mixture i of the original file.
+    """
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, META_NAME), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != COLUMNAR_VERSION:
+            raise ValueError("Unsupported columnar metadata version {}".format(meta["version"]))
+        self.path = path
+        self.names = meta["names"]
+        self.kinds = meta["kinds"]
+        self.vocabs = meta["vocabs"]
+        self.layouts = meta["layouts"]
+        self.schemas = [[tuple(x) for x in s] for s in meta["schemas"]]
+        mmap_mode = "r" if mmap else None
+
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+        self.offsets = load("offsets")
+        self.layout = load("layout")
+        self.seg_key = load("seg_key")
+        self.seg_schema = load("seg_schema")
+        self.columns = {key: load(key) for key in self.kinds}
+        self.list_offsets = {key: load(key + ".offsets") for key, kind in self.kinds.items() if kind == "strlist"}
+        self._name_index = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, mixture_name):
+        if self._name_index is None:
+            self._name_index = {n: i for i, n in enumerate(self.names)}
+        return self._name_index[mixture_name]
+
+    def _value(self, key, typ, j):
+        kind = self.kinds[key]
+        col = self.columns[key]
+        if kind == "str":
+            return self.vocabs[key][col[j]]
+        if kind == "strlist":
+            vocab = self.vocabs[key]
+            start, stop = self.list_offsets[key][j], self.list_offsets[key][j + 1]
+            return [vocab[c] for c in col[start:stop].tolist()]
+        value = col[j].item()
+        return int(value) if typ == "int" else float(value)
+
+    def segment(self, j):
+        return {key: self._value(key, typ, j) for key, typ in self.schemas[self.seg_schema[j]]}
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("mixture index out of range")
+        keys = self.layouts[self.layout[i]]
+        mix = {k: [] for k in keys}
+        mix["mixture_name"] = self.names[i]
+        for j in range(self.offsets[i], self.offsets[i + 1]):
+            mix[keys[self.seg_key[j]]].append(self.segment(j))
+        return mix
+
+
+class JsonlMetadata(Sequence):
+    """Read only list of the mixtures of a .jsonl metadata file, one json mixture per line.
+
+    Only the byte offset of every line is kept in memory, metadata[i] parses line i on access and iterating
+    reads the file sequentially.
+    """
+    def __init__(self, path):
+        self.path = path
+        starts, pos = [], 0
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    starts.append(pos)
+                pos += len(line)
+        self.starts = np.array(starts, dtype=np.int64)
+        self._f = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("mixture index out of range")
+        if self._f is None:
+            self._f = open(self.path, "rb")
+        self._f.seek(int(self.starts[i]))
+        return json.loads(self._f.readline())
+
+    def __iter__(self):
+        return iter_jsonl(self.path)
+
+    def __getstate__(self):
+        # the file is reopened in other processes
+        return dict(self.__dict__, _f=None)
+
+
+def iter_jsonl(path):
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class MetadataWriter:
+    """Writes a metadata file one mixture at a time.
+
+    .jsonl outputs are streamed to disk as mixtures come (memory does not grow with their number) and renamed
+    into place by close(), json and columnar outputs are kept in memory and saved by close().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.n_mixtures = 0
+        self.mixtures, self.f = [], None
+        if path.endswith(JSONL_SUFFIX):
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.f = open(path + ".tmp", "w")
+
+    def write(self, mix):
+        if self.f is not None:
+            self.f.write(json.dumps(mix) + "\n")
+        else:
+            self.mixtures.append(mix)
+        self.n_mixtures += 1
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            os.replace(self.path + ".tmp", self.path)
+        else:
+            save_metadata(self.mixtures, self.path)
+
+    def abort(self):
+        if self.f is not None:
+            self.f.close()
+            os.remove(self.path + ".tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def is_columnar(path):
+    return os.path.isfile(os.path.join(path, META_NAME))
+
+
+def load_metadata(path, mmap=True):
+    # a metadata.json file, a metadata.jsonl file or a columnar metadata dir
+    if is_columnar(path):
+        return ColumnarMetadata(path, mmap)
+    if path.endswith(JSONL_SUFFIX):
+        return JsonlMetadata(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def iter_metadata(path):
+    # mixtures one at a time, .jsonl files are never loaded whole
+    if not is_columnar(path) and path.endswith(JSONL_SUFFIX):
+        return iter_jsonl(path)
+    return iter(load_metadata(path))
+
+
+def save_metadata(metadata, path):
+    # columnar when path ends with .cols, streamed json lines when it ends with .jsonl (metadata can then be
+    # any iterable, e.g. a generator), json (as the shipped metadata) otherwise
+    if path.endswith(COLUMNAR_SUFFIX):
+        save_columnar(metadata if isinstance(metadata, Sequence) else list(metadata), path)
+    elif path.endswith(JSONL_SUFFIX):
+        with MetadataWriter(path) as writer:
+            for mix in metadata:
+                writer.write(mix)
+    else:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(list(metadata), f, indent=4)
+
+
+def find_configs(metadata_dir, names=None):
+    # config name -> metadata path for every <metadata_dir>/<config>/metadata.json (or metadata.jsonl, .cols)
+    configs = {}
+    for f in sorted(glob.glob(os.path.join(metadata_dir, "*", "metadata.json")) +
+                    glob.glob(os.path.join(metadata_dir, "*", "metadata.jsonl")) +
+                    glob.glob(os.path.join(metadata_dir, "*", "metadata.cols"))):
+        name = Path(f).parent.name
+        if names and name not in names or name in configs:
+            continue
+        configs[name] = f
+    if names:
+        missing = set(names) - set(configs.keys())
+        if missing:
+            raise FileNotFoundError("No metadata found for configs : {}".format(sorted(missing)))
+    return configs
@@ -0,0 +1,69 @@
+import functools
+import numpy as np
+from .mixture_utils import render_mixture, load_segment, read_mixture
+from .segment_cache import SegmentCache
+from .audio_index import AudioIndexes
+from .metadata_utils import load_metadata
+from .pipeline_utils import prefetch as prefetch_iter
+from .locality_utils import DecodedFileCache
+
+
+class MixtureGenerator:
+    """Renders SparseLibriMix mixtures in memory from a metadata file (json, jsonl or columnar) or list of metadata entries.
+
+    Each mixture is returned as a dict of numpy arrays with keys s1 ... sN, mix_clean and, when
+    noise_dir is given, noise and mix_noisy, exactly as make_mixtures.py would write them.
+    Audio headers are taken from the persistent header index of librispeech_dir and noise_dir,
+    call save_index() to store newly probed files. Audio is decoded, processed and mixed in dtype.
+    With file_cache_size (GB) > 0 source files are decoded whole once and kept in an LRU, segments are sliced
+    from them (see locality_utils), best with mixtures ordered by locality_utils.locality_order.
+    """
+    def __init__(self, metadata, librispeech_dir, noise_dir="", rate=16000, cache_dir="", cache_size=10,
+                 dtype=np.float64, index=None, file_cache_size=0):
+        if isinstance(metadata, str):
+            metadata = load_metadata(metadata)
+        self.metadata = metadata
+        self.librispeech_dir = librispeech_dir
+        self.noise_dir = noise_dir
+        self.rate = rate
+        self.dtype = dtype
+        self.cache = SegmentCache(cache_dir, int(cache_size * 2 ** 30), params={"dtype": np.dtype(dtype).name}) \
+            if cache_dir else None
+        self.index = index if index is not None else AudioIndexes([librispeech_dir, noise_dir])
+        self.file_cache = DecodedFileCache(int(file_cache_size * 2 ** 30), dtype) if file_cache_size > 0 else None
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def __getitem__(self, idx):
+        return self.render(self.metadata[idx])
+
+    def render(self, mix, decoded=None):
+        # decoded: segments already read with read(mix), ignored when segments come from the cache
+        load = None
+        read = self.file_cache.read if self.file_cache is not None else None
+        if self.cache is not None:
+            load = functools.partial(self.cache.load, compute=functools.partial(load_segment, index=self.index,
+                                                                                read=read, dtype=self.dtype))
+        elif decoded is None and self.file_cache is not None:
+            decoded = self.read(mix)
+        return render_mixture(mix, self.librispeech_dir, self.noise_dir, self.rate, load=load, dtype=self.dtype,
+                              index=self.index, decoded=decoded)
+
+    def read(self, mix):
+        # I/O part of render, can run in another thread
+        if self.file_cache is not None:
+            return self.file_cache.read_mixture(mix, self.librispeech_dir, self.noise_dir)
+        return read_mixture(mix, self.librispeech_dir, self.noise_dir, self.index, self.dtype)
+
+    def save_index(self):
+        self.index.save()
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, prefetch=0, workers=2):
+        # yields (mixture_name, streams) lazily in metadata order, with prefetch > 0 up to prefetch
+        # mixtures are rendered ahead by a thread pool
+        for mix, streams in zip(self.metadata, prefetch_iter(self.render, self.metadata, prefetch, workers)):
+            yield mix["mixture_name"], streams
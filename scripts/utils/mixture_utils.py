@@ -0,0 +1,194 @@
+import io
+import os
+import hashlib
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+from .loudness_utils import normalize
+from .profiling_utils import get_timer
+from .wav_utils import read_wav_window
+
+# max abs difference of any output sample rendered in float32 instead of float64, 1/10 of a PCM_16 step.
+# Checked by compare_dtypes.py
+FLOAT32_TOLERANCE = 1 / 0x8000 / 10
+
+
+def resample(signal, orig, target):
+    if orig != target:
+        with get_timer().phase("resample"):
+            signal = resample_poly(signal, target, orig)
+    return signal
+
+
+def resample_and_norm(signal, orig, target, lvl):
+
+    signal = resample(signal, orig, target)
+
+    #fx = (AudioEffectsChain().custom("norm {}".format(lvl)))
+    #signal = fx(signal)
+
+    with get_timer().phase("loudness"):
+        return normalize([signal], target, [lvl])[0]
+
+
+def get_utterance_path(utt, librispeech_dir, noise_dir):
+    # returns None for noise utterances when generating only the clean version
+    if utt["source"] != "noise": # speech file
+        return os.path.join(librispeech_dir, utt["file"])
+    if noise_dir:
+        return os.path.join(noise_dir, utt["file"])
+    return None
+
+
+def read_utterance(utt, path, index=None, dtype=np.float64):
+    # index (audio_index.AudioIndex or AudioIndexes) avoids opening the file just to get its rate.
+    # Samples are decoded directly to dtype (float64 or float32)
+    utt_fs = index.samplerate(path) if index is not None else sf.SoundFile(path).samplerate
+    start, stop = int(utt["orig_start"]*utt_fs), int(utt["orig_stop"]*utt_fs)
+    timer = get_timer()
+    with timer.phase("read"):
+        # PCM wavs (noises) are memory mapped and only the used channel is converted, soundfile otherwise
+        out = read_wav_window(path, start, stop, utt.get("channel"), dtype) if path.lower().endswith(".wav") else None
+        if out is None:
+            audio, fs = sf.read(path, start=start, stop=stop, dtype=dtype)
+        else:
+            audio, fs = out
+    if timer.enabled:
+        # compressed bytes are estimated as the read fraction of the file
+        info = index.info(path) if index is not None else {"frames": sf.info(path).frames}
+        timer.add("bytes_read", os.path.getsize(path) * len(audio) / max(info["frames"], 1))
+
+    #assert len(audio.shape) == 1, "we currently not support multichannel"
+    if len(audio.shape) > 1:
+        audio = audio[:, utt["channel"]] #TODO
+    audio = audio - np.mean(audio) # zero mean cos librispeech is messed up sometimes
+
+    return audio, fs
+
+
+def load_segment(utt, path, rate, index=None, read=None, dtype=np.float64):
+    # read(utt, path) replaces read_utterance, e.g. locality_utils.DecodedFileCache.read
+    audio, fs = read(utt, path) if read is not None else read_utterance(utt, path, index, dtype)
+    return resample_and_norm(audio, fs, rate, utt["lvl"])
+
+
+def read_key(utt, path):
+    # identifies the decoded (not yet resampled) audio of a segment
+    return path, utt["orig_start"], utt["orig_stop"], utt.get("channel")
+
+
+def segment_key(utt, path, rate):
+    # identifies a resampled and loudness normalized segment
+    return read_key(utt, path) + (utt["lvl"], rate)
+
+
+def mixture_utterances(mix, librispeech_dir, noise_dir):
+    # (source, utt, path) of every segment to mix, in metadata order
+    utts = []
+    for source in [x for x in mix.keys() if x != "mixture_name"]:
+        for utt in mix[source]:
+            path = get_utterance_path(utt, librispeech_dir, noise_dir)
+            if path is None:
+                continue
+            utts.append((source, utt, path))
+    return utts
+
+
+def read_mixture(mix, librispeech_dir, noise_dir, index=None, dtype=np.float64):
+    # decoded (audio, fs) of every segment of the mixture, the I/O part of load_mixture_segments
+    return [read_utterance(utt, path, index, dtype)
+            for _, utt, path in mixture_utterances(mix, librispeech_dir, noise_dir)]
+
+
+def load_mixture_segments(mix, librispeech_dir, noise_dir, rate, load=None, index=None, decoded=None,
+                          dtype=np.float64):
+    # returns a list of (source, offset in samples, normalized segment) in metadata order.
+    # load(utt, path, rate) returns the normalized segment, by default all segments of the mixture
+    # are decoded to dtype and loudness normalized together in one batch. decoded is the output of
+    # read_mixture when segments were already read (e.g. prefetched by another thread).
+    utts = mixture_utterances(mix, librispeech_dir, noise_dir)
+
+    if load is not None:
+        signals = [load(utt, path, rate) for _, utt, path in utts]
+    else:
+        if decoded is None:
+            decoded = [read_utterance(utt, path, index, dtype) for _, utt, path in utts]
+        signals = [resample(audio, fs, rate) for audio, fs in decoded]
+        with get_timer().phase("loudness"):
+            signals = normalize(signals, rate, [utt["lvl"] for _, utt, _ in utts])
+
+    return [(source, int(utt["start"]*rate), signal) for (source, utt, _), signal in zip(utts, signals)]
+
+
+def mix_segments(segments, with_noise, dtype=np.float64):
+    # Sums the segments of each source in a single (n_sources, T) buffer allocated once per mixture.
+    # T is the end of the last segment (the noise segment spans the whole mixture when present).
+    # Segments are added in metadata order so the result is the same as padding and summing them.
+    rows = {}
+    length = 0
+    for source, offset, signal in segments:
+        rows.setdefault(source, len(rows))
+        length = max(length, offset + len(signal))
+
+    buffer = np.zeros((len(rows), length), dtype=dtype)
+    for source, offset, signal in segments:
+        buffer[rows[source], offset:offset + len(signal)] += signal
+
+    # mix n sum
+    streams = {}
+    tot_mixture = None
+    for s, row in rows.items():
+        if s == "noise":
+            continue
+        streams[s] = buffer[row]
+        if tot_mixture is None:
+            tot_mixture = buffer[row].copy()
+        else:
+            tot_mixture += buffer[row]
+    streams["mix_clean"] = tot_mixture
+
+    if with_noise:
+        noise = buffer[rows["noise"]] if "noise" in rows else np.zeros(length, dtype=dtype)
+        streams["noise"] = noise
+        streams["mix_noisy"] = tot_mixture + noise
+
+    return streams
+
+
+def render_mixture(mix, librispeech_dir, noise_dir, rate, load=None, dtype=np.float64, index=None, decoded=None):
+    # returns an ordered dict stream name -> signal, streams are s1 ... sN, mix_clean and,
+    # if noise_dir is given, noise and mix_noisy. dtype is used from decoding to mixing, float32
+    # stays within FLOAT32_TOLERANCE of float64 (see compare_dtypes.py).
+    segments = load_mixture_segments(mix, librispeech_dir, noise_dir, rate, load=load, index=index,
+                                     decoded=decoded, dtype=dtype)
+    with get_timer().phase("mix"):
+        return mix_segments(segments, bool(noise_dir), dtype=dtype)
+
+
+def mixture_paths(mix, librispeech_dir, noise_dir):
+    return [path for _, _, path in mixture_utterances(mix, librispeech_dir, noise_dir)]
+
+
+def write_wav(path, signal, rate, subtype="PCM_16"):
+    # the wav is encoded in memory and moved in place, a killed run never leaves a partial file behind
+    timer = get_timer()
+    with timer.phase("encode"):
+        buf = io.BytesIO()
+        sf.write(buf, signal, rate, format="WAV", subtype=subtype)
+        data = buf.getvalue()
+    with timer.phase("write"):
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    timer.add("bytes_written", len(data))
+    return {"sha1": hashlib.sha1(data).hexdigest(), "size": len(data)}
+
+
+def write_mixture(out_dir, filename, streams, rate, subtype="PCM_16"):
+    # returns the checksum and size of each written file
+    files = {}
+    for s, signal in streams.items():
+        os.makedirs(os.path.join(out_dir, s), exist_ok=True)
+        files[s] = write_wav(os.path.join(out_dir, s, filename + ".wav"), signal, rate, subtype)
+    return files
@@ -0,0 +1,123 @@
+import random
+import numpy as np
+
+
+def _others_bound(values, others, reduce, fill):
+    # min (or max) over the other speakers of the non zero values, per ratio
+    masked = np.where((values != 0) & others, values, fill)
+    out = reduce(masked, axis=1)
+    if np.any(out == fill):
+        raise ValueError("no previous utterance from another speaker") # min()/max() of an empty list
+    return out
+
+
+def schedule_mixture(mixture, ratios, version, rngs, np_rngs):
+    # start/stop of all sub utterances of a no overlap mixture for every ratio at once.
+    # lasts holds [start, stop] of the last utterance of each speaker for each ratio: (n_ratios, n_speakers, 2)
+    ratios = np.asarray(ratios, dtype=np.float64)
+    sub_utts = []
+    for k in mixture:
+        if k.startswith("s"): # is a source
+            for sub in mixture[k]:
+                sub_utts.append(sub)
+    sub_utts = sorted(sub_utts, key= lambda x : x["sub_utt_num"])
+    c_speakers = [mixture[k][0]["spk_id"] for k in mixture.keys() if k.startswith("s")]
+    spk_indx = {spk: i for i, spk in enumerate(c_speakers)}
+
+    lasts = np.zeros((len(ratios), len(c_speakers), 2))
+    metadata = [[] for _ in ratios]
+    maxlength = np.full(len(ratios), -1.)
+    c_spk = None
+    for n, sub_utt in enumerate(sub_utts):
+        prev_spk = sub_utt["spk_id"] if n == 0 else c_spk
+        c_spk = sub_utt["spk_id"]
+        c, prev = spk_indx[c_spk], spk_indx[prev_spk]
+        others = (np.arange(len(c_speakers)) != c)[None]
+
+        if lasts[0, prev, 1] != 0: # same for all ratios
+            # not first utterance
+            if version in [1, 3]:
+                stop = _others_bound(lasts[:, :, 1], others, np.min, np.inf)
+                start = _others_bound(lasts[:, :, 0], others, np.max, -np.inf)
+            elif version == 2:
+                start, stop = lasts[:, prev, 0], lasts[:, prev, 1]
+            else:
+                raise ValueError
+
+            lastlen = stop - start
+            offset = lastlen * ratios
+            if version == 3:
+                # basically instead of adding it up on the right we include also the option to add the segment on the left
+                c_length = sub_utt["stop"] - sub_utt["start"]
+                left = (start + offset) - c_length
+                offset = stop - offset
+                for r in np.flatnonzero(left > 0.1):
+                    offset[r] = rngs[r].choice([offset[r], left[r]])
+            else:
+                offset = stop - offset
+            it = np.maximum(offset, lasts[:, c, 1] + 0.05)
+        else:
+            it = np.full(len(ratios), sub_utt["start"])
+
+        length = sub_utt["stop"] - sub_utt["start"]
+        maxlength = np.maximum(maxlength, it + length)
+        start = np.round(it, 3)
+        stop = np.round(it + length, 3)
+        for r in range(len(ratios)):
+            metadata[r].append({"file": sub_utt["file"], "words": sub_utt["words"],
+                                "spk_id": sub_utt["spk_id"],
+                                "chapter_id": sub_utt["chapter_id"], "utt_id": sub_utt["utt_id"],
+                                "start": float(start[r]),
+                                "stop": float(stop[r]),
+                                "orig_start": sub_utt["orig_start"],
+                                "orig_stop": sub_utt["orig_stop"], "lvl": sub_utt["lvl"],
+                                "source": sub_utt["source"], "sub_utt_num": sub_utt["sub_utt_num"]})
+        lasts[:, c, 0] = start
+        lasts[:, c, 1] = stop  # can't overlap with itself
+
+    noise = mixture["noise"][0]
+    out = []
+    for r in range(len(ratios)):
+        c_maxlength = float(maxlength[r]) + np_rngs[r].uniform(0.2, 0.5)  # ASR purposes we add some silence at end
+        metadata[r].append({"file": noise["file"],
+                            "start": 0,
+                            "stop": c_maxlength, "orig_start": noise["orig_start"],
+                            "orig_stop": noise["orig_start"] + c_maxlength,
+                            "lvl": noise["lvl"], "source": "noise", "channel": noise["channel"]})
+
+        mixture_metadata = {"mixture_name": mixture["mixture_name"]}
+        for elem in metadata[r]:
+            mixture_metadata.setdefault(elem["source"], []).append(elem)
+        out.append(mixture_metadata)
+    return out
+
+
+def iter_overlaps(no_ov, ratios, version=1, seed=None):
+    """Yields, for every mixture of the no overlap metadata (any iterable), its overlap metadata for every ratio.
+
+    Each ratio has its own random generators seeded with seed, so the output for a ratio is the same as
+    generating that ratio alone with the same seed. Nothing is kept from one mixture to the next.
+    """
+    if any(r == 0 for r in ratios):
+        raise ValueError("ovr_ratio must be different from 0")
+    rngs = [random.Random(seed) for _ in ratios]
+    np_rngs = [np.random.RandomState(seed) for _ in ratios]
+    for mixture in no_ov:
+        yield schedule_mixture(mixture, ratios, version, rngs, np_rngs)
+
+
+def schedule_overlaps(no_ov, ratios, version=1, seed=None):
+    """Overlap metadata for every ratio in ratios from no overlap metadata, in a single pass.
+
+    Returns one metadata list per ratio, see iter_overlaps.
+    """
+    total_metadata = [[] for _ in ratios]
+    for mixes in iter_overlaps(no_ov, ratios, version, seed):
+        for r, mix in enumerate(mixes):
+            total_metadata[r].append(mix)
+    return total_metadata
+
+
+def format_ratio(ratio):
+    # 0.2 -> "0.2", 1.0 -> "1" as in the metadata dir names
+    return "{:g}".format(ratio)
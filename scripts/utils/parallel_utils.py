@@ -0,0 +1,108 @@
+import multiprocessing
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def _call(fn, item):
+    try:
+        return fn(item)
+    except Exception as e:
+        # exceptions are re-raised in the parent, we keep which item failed
+        raise WorkerError("{} failed on {!r} : {}: {}".format(getattr(fn, "__name__", fn), _describe(item),
+                                                              type(e).__name__, e)) from None
+
+
+def _describe(item):
+    if isinstance(item, dict) and "mixture_name" in item:
+        return item["mixture_name"]
+    text = repr(item)
+    return text if len(text) < 80 else text[:77] + "..."
+
+
+class _Task:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, item):
+        return _call(self.fn, item)
+
+
+_barrier = None
+_shared_pool = None
+
+
+def _set_barrier(barrier):
+    global _barrier
+    _barrier = barrier
+
+
+def _init_one(initializer, initargs):
+    # every worker takes exactly one of these tasks : it blocks until all workers got theirs
+    if initializer is not None:
+        initializer(*initargs)
+    _barrier.wait()
+
+
+class SharedPool:
+    """Pool of worker processes reused by successive imap_jobs calls, e.g. all the stages of run_pipeline.py.
+
+    Processes are started once instead of once per call, the initializer of each call is run in every
+    worker before its items. Install it with set_shared_pool(), imap_jobs then uses it whenever jobs > 1.
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+        barrier = multiprocessing.Barrier(jobs)
+        self.pool = multiprocessing.Pool(jobs, initializer=_set_barrier, initargs=(barrier,))
+
+    def initialize(self, initializer, initargs=()):
+        self.pool.starmap(_init_one, [(initializer, initargs)] * self.jobs, chunksize=1)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def set_shared_pool(pool):
+    # pool : SharedPool or None
+    global _shared_pool
+    _shared_pool = pool
+
+
+def _imap_shared(pool, fn, items, initializer, initargs, chunksize, ordered):
+    pool.initialize(initializer, initargs)
+    mapper = pool.pool.imap if ordered else pool.pool.imap_unordered
+    yield from mapper(_Task(fn), items, chunksize=chunksize)
+
+
+def imap_jobs(fn, items, jobs=1, initializer=None, initargs=(), chunksize=1, ordered=True):
+    # maps fn over items with a pool of jobs processes, jobs=1 runs in this process.
+    # fn and initializer must be picklable (module level functions). The first failure stops the pool.
+    # With a shared pool installed (set_shared_pool) its processes are used instead of new ones.
+    if jobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield _call(fn, item)
+        return
+
+    if _shared_pool is not None:
+        yield from _imap_shared(_shared_pool, fn, items, initializer, initargs, chunksize, ordered)
+        return
+
+    pool = multiprocessing.Pool(jobs, initializer=initializer, initargs=initargs)
+    try:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        for res in mapper(_Task(fn), items, chunksize=chunksize):
+            yield res
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,36 @@
+import heapq
+
+# Split of the mixtures of a metadata file into work shards rendered on different machines (not to be confused
+# with the output shard files of shard_utils). Shards are balanced on rendered audio duration and the split
+# only depends on the metadata, so every machine and merge_shards.py compute the same one.
+
+
+def mixture_duration(mix):
+    # seconds of audio of every output stream, the end of the last segment
+    return max(utt["stop"] for source, utts in mix.items() if source != "mixture_name" for utt in utts)
+
+
+def balanced_partition(weights, n_parts):
+    # longest processing time first : items by decreasing weight go to the part with the smallest load so far,
+    # ties by position and part number. Returns the item positions of each part, in increasing order.
+    if n_parts < 1:
+        raise ValueError("n_parts must be at least 1, got {}".format(n_parts))
+    loads = [(0., p) for p in range(n_parts)]
+    parts = [[] for _ in range(n_parts)]
+    for i in sorted(range(len(weights)), key=lambda i: (-weights[i], i)):
+        load, p = heapq.heappop(loads)
+        parts[p].append(i)
+        heapq.heappush(loads, (load + weights[i], p))
+    return [sorted(x) for x in parts]
+
+
+def shard_positions(metadata, num_shards):
+    # positions in the metadata of the mixtures of every shard
+    return balanced_partition([mixture_duration(mix) for mix in metadata], num_shards)
+
+
+def select_shard(metadata, shard, num_shards):
+    # mixtures of shard (0 based) out of num_shards, in metadata order
+    if not 0 <= shard < num_shards:
+        raise ValueError("shard must be in [0, {}), got {}".format(num_shards, shard))
+    return [metadata[i] for i in shard_positions(metadata, num_shards)[shard]]
@@ -0,0 +1,90 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_STOP = object()
+
+
+def prefetch(fn, items, depth, workers=2):
+    # yields fn(item) in order while up to depth items ahead are computed by a thread pool
+    if depth <= 0:
+        for item in items:
+            yield fn(item)
+        return
+
+    pool = ThreadPoolExecutor(workers)
+    try:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) > depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class BackgroundWorker:
+    """Calls fn(*args) for each submit() on one background thread, in submission order.
+
+    The input queue holds at most depth items, submit() blocks when it is full so that memory stays
+    bounded. Results are collected with completed() (non blocking) and close(). An exception raised
+    by fn is re-raised in the submitting thread and stops the worker.
+    """
+    def __init__(self, fn, depth=4):
+        self.fn = fn
+        self.inputs = queue.Queue(max(depth, 1))
+        self.results = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            args = self.inputs.get()
+            if args is _STOP:
+                return
+            if self.error is not None:
+                continue # drains the queue so that submit() never blocks forever
+            try:
+                self.results.put(self.fn(*args))
+            except BaseException as e:
+                self.error = e
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, *args):
+        self._check()
+        self.inputs.put(args)
+
+    def completed(self):
+        # results available so far
+        out = []
+        while True:
+            try:
+                out.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        self._check()
+        return out
+
+    def close(self):
+        # waits for all submitted items and returns the remaining results
+        if self.thread.is_alive():
+            self.inputs.put(_STOP)
+            self.thread.join()
+        return self.completed()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.thread.is_alive():
+            if exc[1] is not None and self.error is None:
+                self.error = exc[1] # stopped by the caller, queued items are dropped
+            self.inputs.put(_STOP)
+            self.thread.join()
@@ -0,0 +1,157 @@
+import os
+import glob
+import time
+import cProfile
+import pstats
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Optional instrumentation of the render loop. The hot path calls get_timer().phase(name) and
+# get_timer().add(counter, value), by default the timer is a NullTimer whose methods do nothing so that
+# the overhead is a function call per phase. Each process has its own timer, workers send pop() to the parent.
+# Within a process the timer is shared by all threads (e.g. the I/O threads of make_mixtures.py --pipeline):
+# updates hold a lock, and phases timed outside the main thread are flagged as background, their time is
+# thread-seconds spent in parallel with the main thread and is not part of the main thread shares.
+
+_NULL_CONTEXT = nullcontext()
+
+
+class NullTimer:
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_CONTEXT
+
+    def add(self, name, value):
+        pass
+
+    def pop(self):
+        return None
+
+
+class StageTimer:
+    """Cumulative wall time and number of calls per phase plus counters (bytes, audio seconds ...), thread safe."""
+    enabled = True
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(float)
+        self.background = set() # phases timed outside the main thread
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.seconds[name] += elapsed
+                self.calls[name] += 1
+                if threading.current_thread() is not threading.main_thread():
+                    self.background.add(name)
+
+    def add(self, name, value):
+        with self._lock:
+            self.counters[name] += value
+
+    def pop(self):
+        # stats since the last pop, to be merged in the parent process
+        with self._lock:
+            stats = {"seconds": dict(self.seconds), "calls": dict(self.calls), "counters": dict(self.counters),
+                     "background": sorted(self.background)}
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+        return stats
+
+    def merge(self, stats):
+        if stats is None:
+            return
+        with self._lock:
+            for k, v in stats["seconds"].items():
+                self.seconds[k] += v
+            for k, v in stats["calls"].items():
+                self.calls[k] += v
+            for k, v in stats["counters"].items():
+                self.counters[k] += v
+            self.background.update(stats.get("background", ()))
+
+    def foreground(self):
+        return {k: v for k, v in self.seconds.items() if k not in self.background}
+
+    def postfix(self, elapsed):
+        # short live rates for the tqdm postfix
+        out = {}
+        if "audio_seconds" in self.counters:
+            out["audio"] = "{:.1f}s/s".format(self.counters["audio_seconds"] / elapsed)
+        if "bytes_written" in self.counters:
+            out["write"] = "{:.1f}MB/s".format(self.counters["bytes_written"] / elapsed / 2 ** 20)
+        seconds = self.foreground()
+        total = sum(seconds.values())
+        if total > 0:
+            top = max(seconds, key=seconds.get)
+            out["top"] = "{} {:.0f}%".format(top, 100 * seconds[top] / total)
+        return out
+
+    def summary(self, elapsed, n_items=None):
+        # shares are of the main thread time, background phases are thread-seconds (share of elapsed, summed
+        # over threads, it can be above 1)
+        total = sum(self.foreground().values())
+        phases = {}
+        for k in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            background = k in self.background
+            phases[k] = {"seconds": self.seconds[k], "calls": self.calls[k], "background": background,
+                         "share": self.seconds[k] / (elapsed if background else total) if total and elapsed else 0.}
+        rates = {k + "_per_s": v / elapsed for k, v in self.counters.items()}
+        if n_items is not None:
+            rates["mixtures_per_s"] = n_items / elapsed
+        # with several worker processes phase times add up over workers and can exceed elapsed
+        return {"elapsed": elapsed, "mixtures": n_items, "phases": phases, "counters": dict(self.counters),
+                "rates": rates}
+
+
+_timer = NullTimer()
+
+
+def get_timer():
+    return _timer
+
+
+def set_timer(timer):
+    global _timer
+    _timer = timer
+
+
+class WindowProfiler:
+    """cProfile over a window of items. Each process dumps its stats in out_file.<pid>, merge() gathers them
+    in out_file (use snakeviz, pstats ...)."""
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.profile = None
+
+    def run(self, fn, *args):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+        self.profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            self.profile.disable()
+            self.profile.dump_stats("{}.{}".format(self.out_file, os.getpid()))
+
+    def merge(self):
+        parts = sorted(glob.glob(glob.escape(self.out_file) + ".*"))
+        parts = [x for x in parts if x.rsplit(".", 1)[-1].isdigit()]
+        if not parts:
+            return None
+        stats = pstats.Stats(parts[0])
+        for p in parts[1:]:
+            stats.add(p)
+        stats.dump_stats(self.out_file)
+        for p in parts:
+            os.remove(p)
+        return stats
@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from .mixture_utils import load_segment
+from .profiling_utils import get_timer
+
+# bumped whenever the processing of segments changes so that stale entries are not reused
+CACHE_VERSION = 2
+
+
+class SegmentCache:
+    # Content addressed on disk cache of decoded, resampled and loudness normalized segments.
+    # Each segment is a .npy file which is loaded memory mapped, least recently used files
+    # are removed once the cache grows over max_size bytes. params is added to every key and must
+    # contain anything else the processing depends on.
+    def __init__(self, cache_dir, max_size=10 * 2 ** 30, params=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.params = params or {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(x[-1] for x in self._entries())
+
+    def _entries(self):
+        entries = []
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for f in os.scandir(sub.path):
+                if f.name.endswith(".npy"):
+                    try:
+                        st = f.stat()
+                    except FileNotFoundError: # removed by another process
+                        continue
+                    entries.append((st.st_mtime_ns, f.path, st.st_size))
+        return entries
+
+    def key(self, utt, path, rate):
+        st = os.stat(path)
+        desc = [os.path.abspath(path), st.st_mtime_ns, st.st_size, utt["orig_start"], utt["orig_stop"],
+                utt.get("channel"), utt["lvl"], rate, CACHE_VERSION, self.params]
+        return hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def get(self, key):
+        f = self._path(key)
+        try:
+            signal = np.load(f, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        try:
+            os.utime(f) # mtime is used as last access time for LRU eviction
+        except FileNotFoundError:
+            pass
+        return signal
+
+    def put(self, key, signal):
+        f = self._path(key)
+        os.makedirs(os.path.dirname(f), exist_ok=True)
+        # written to a temporary file first so concurrent readers never see partial segments
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(f), suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            np.save(fh, np.ascontiguousarray(signal))
+        os.replace(tmp, f)
+        self.size += os.path.getsize(f)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self, target=0.9):
+        entries = sorted(self._entries())
+        self.size = sum(x[-1] for x in entries)
+        for _, f, size in entries:
+            if self.size <= self.max_size * target:
+                break
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.evicted += 1
+
+    def load(self, utt, path, rate, compute=load_segment):
+        # same signature as mixture_utils.load_segment, compute is called on a miss
+        key = self.key(utt, path, rate)
+        with get_timer().phase("cache"):
+            signal = self.get(key)
+        if signal is not None:
+            self.hits += 1
+            return signal
+        self.misses += 1
+        signal = compute(utt, path, rate)
+        with get_timer().phase("cache"):
+            self.put(key, signal)
+        return signal
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted, "size": self.size}
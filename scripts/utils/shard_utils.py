@@ -0,0 +1,125 @@
+import io
+import os
+import json
+import numpy as np
+import soundfile as sf
+
+# soundfile subtype -> dtype of the raw payload (little endian)
+SUBTYPE_DTYPES = {"PCM_16": "<i2", "PCM_32": "<i4", "FLOAT": "<f4", "DOUBLE": "<f8"}
+INDEX_NAME = "index.json"
+
+
+def encode(signal, subtype):
+    # encodes with libsndfile so that samples are exactly those a wav with this subtype would contain
+    buf = io.BytesIO()
+    sf.write(buf, signal, 8000, format="RAW", subtype=subtype, endian="LITTLE") # rate is unused by RAW
+    return buf.getvalue()
+
+
+class ShardWriter:
+    """Packs many signals into a few large shard files plus an index.json.
+
+    Shards contain only raw PCM, the index stores for each (mixture, stream) the shard, byte offset and
+    length in frames. A new shard is started once shard_size bytes are exceeded. params (e.g. the render params
+    of manifest_utils) are stored as is in the index.
+    """
+    def __init__(self, out_dir, rate, subtype="PCM_16", shard_size=2 ** 30, params=None):
+        if subtype not in SUBTYPE_DTYPES:
+            raise ValueError("Unsupported subtype {}, choose from {}".format(subtype, list(SUBTYPE_DTYPES)))
+        self.out_dir = out_dir
+        self.rate = rate
+        self.subtype = subtype
+        self.shard_size = shard_size
+        self.params = params or {}
+        self.shards = []
+        self.entries = []
+        self._fh = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _open_shard(self):
+        if self._fh is not None:
+            self._fh.close()
+        name = "shard_{:05d}.bin".format(len(self.shards))
+        self.shards.append(name)
+        self._fh = open(os.path.join(self.out_dir, name), "wb")
+
+    def write_encoded(self, mixture_name, stream, payload):
+        if self._fh is None or self._fh.tell() >= self.shard_size:
+            self._open_shard()
+        offset = self._fh.tell()
+        self._fh.write(payload)
+        self.entries.append({"mixture_name": mixture_name, "stream": stream, "shard": len(self.shards) - 1,
+                             "offset": offset,
+                             "length": len(payload) // np.dtype(SUBTYPE_DTYPES[self.subtype]).itemsize})
+
+    def write(self, mixture_name, stream, signal):
+        self.write_encoded(mixture_name, stream, encode(signal, self.subtype))
+
+    def write_mixture(self, mixture_name, streams):
+        # streams of a mixture are stored contiguously
+        for s, signal in streams.items():
+            self.write(mixture_name, s, signal)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        index = {"version": 1, "rate": self.rate, "subtype": self.subtype, "dtype": SUBTYPE_DTYPES[self.subtype],
+                 "params": self.params, "shards": self.shards, "entries": self.entries}
+        tmp = os.path.join(self.out_dir, INDEX_NAME + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.out_dir, INDEX_NAME))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """Memory mapped reader of a directory written by ShardWriter.
+
+    get() returns zero-copy views in the stored dtype, use read() for float signals as sf.read returns them.
+    """
+    def __init__(self, shard_dir):
+        with open(os.path.join(shard_dir, INDEX_NAME), "r") as f:
+            index = json.load(f)
+        self.shard_dir = shard_dir
+        self.rate = index["rate"]
+        self.subtype = index["subtype"]
+        self.dtype = np.dtype(index["dtype"])
+        self.shards = [np.memmap(os.path.join(shard_dir, x), dtype=np.uint8, mode="r") if
+                       os.path.getsize(os.path.join(shard_dir, x)) else np.zeros(0, dtype=np.uint8)
+                       for x in index["shards"]]
+        self.index = {}
+        for e in index["entries"]:
+            self.index.setdefault(e["mixture_name"], {})[e["stream"]] = (e["shard"], e["offset"], e["length"])
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, mixture_name):
+        return mixture_name in self.index
+
+    def names(self):
+        return list(self.index.keys())
+
+    def streams(self, mixture_name):
+        return list(self.index[mixture_name].keys())
+
+    def get(self, mixture_name, stream):
+        shard, offset, length = self.index[mixture_name][stream]
+        nbytes = length * self.dtype.itemsize
+        return self.shards[shard][offset:offset + nbytes].view(self.dtype)
+
+    def read(self, mixture_name, stream, dtype=np.float64):
+        signal = self.get(mixture_name, stream)
+        if self.dtype.kind == "i":
+            # same scaling libsndfile uses when reading pcm as float
+            return signal.astype(dtype) / 2 ** (8 * self.dtype.itemsize - 1)
+        return signal.astype(dtype)
+
+    def __getitem__(self, mixture_name):
+        return {s: self.get(mixture_name, s) for s in self.index[mixture_name].keys()}
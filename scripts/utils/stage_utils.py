@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import hashlib
+from .manifest_utils import file_sha1
+
+# Stages of run_pipeline.py are skipped when up to date : a stage is fingerprinted by its parameters and its inputs
+# (content sha1 of files, so a rerun upstream stage producing the same outputs does not invalidate the next ones,
+# path, size and mtime of every file of input dirs such as LibriSpeech) and the fingerprint is stamped in
+# <state_dir>/<stage>.json once the stage succeeded.
+
+
+def dir_listing(root):
+    # (relpath, size, mtime_ns) of every file under root, sorted
+    listing = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            listing.append((os.path.relpath(path, root), st.st_size, st.st_mtime_ns))
+    return listing
+
+
+def input_fingerprint(path):
+    if os.path.isfile(path):
+        return ["file", file_sha1(path)]
+    if os.path.isdir(path):
+        return ["dir", dir_listing(path)]
+    return ["missing"]
+
+
+def fingerprint(params, inputs):
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    for path in inputs:
+        h.update(json.dumps([os.path.abspath(path), input_fingerprint(path)]).encode())
+    return h.hexdigest()
+
+
+class Stage:
+    """A step of the pipeline : run() reads inputs (files or dirs) and writes outputs (files or dirs)."""
+    def __init__(self, name, run, inputs, outputs, params=None):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+
+class StageRunner:
+    def __init__(self, state_dir, force=(), dry_run=False):
+        self.state_dir = state_dir
+        self.force = set(force)
+        self.dry_run = dry_run
+
+    def stamp_path(self, stage):
+        return os.path.join(self.state_dir, "{}.json".format(stage.name))
+
+    def is_up_to_date(self, stage, digest):
+        try:
+            with open(self.stamp_path(stage), "r") as f:
+                stamp = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return stamp.get("fingerprint") == digest and all(os.path.exists(x) for x in stage.outputs)
+
+    def run(self, stage):
+        # returns True when the stage was run
+        digest = fingerprint(stage.params, stage.inputs)
+        forced = stage.name in self.force or "all" in self.force
+        if not forced and self.is_up_to_date(stage, digest):
+            print("Stage {} : up to date".format(stage.name))
+            return False
+        print("Stage {} : {}".format(stage.name, "would run" if self.dry_run else "running"))
+        if self.dry_run:
+            return True
+        t0 = time.perf_counter()
+        stage.run()
+        elapsed = time.perf_counter() - t0
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp = self.stamp_path(stage) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fingerprint": digest, "params": stage.params, "seconds": elapsed}, f, indent=4)
+        os.replace(tmp, self.stamp_path(stage))
+        print("Stage {} : done in {:.1f} s".format(stage.name, elapsed))
+        return True
@@ -0,0 +1,131 @@
+import numpy as np
+from .metadata_utils import ColumnarMetadata
+
+# Overlap and speaker statistics computed from the metadata alone (start/stop of the segments), for all mixtures
+# of a metadata file at once: segment boundaries are quantized to frames and swept in one sorted pass, the number
+# of active speakers between two consecutive boundaries gives the frames with 1, 2, 3 ... speakers.
+# With frame_rate=100 the results are the same as the shipped metadata/*/stats/*.json.
+
+MIN_SPK_KEYS = 3 # shipped stats always have 1spk, 2spk and 3spk
+
+
+class SegmentTable:
+    """Flat arrays of the speech segments (noise excluded) of all the mixtures of a metadata list.
+
+    mix, start, stop, spk (codes in speakers, in order of first appearance) and order (sub_utt_num) have one
+    entry per segment, in metadata order. Columnar metadata is read from its columns without building dicts.
+    """
+    def __init__(self, metadata):
+        self.names = list(metadata.names) if isinstance(metadata, ColumnarMetadata) else \
+            [mix["mixture_name"] for mix in metadata]
+        if isinstance(metadata, ColumnarMetadata):
+            self._from_columns(metadata)
+        else:
+            self._from_dicts(metadata)
+
+    def _from_dicts(self, metadata):
+        mix, start, stop, spk, order = [], [], [], [], []
+        codes = {}
+        for i, m in enumerate(metadata):
+            for source, utts in m.items():
+                if source in ["mixture_name", "noise"]:
+                    continue
+                for utt in utts:
+                    mix.append(i)
+                    start.append(utt["start"])
+                    stop.append(utt["stop"])
+                    spk.append(codes.setdefault(utt["spk_id"], len(codes)))
+                    order.append(utt.get("sub_utt_num", 0))
+        self.mix = np.array(mix, dtype=np.int64)
+        self.start = np.array(start, dtype=np.float64)
+        self.stop = np.array(stop, dtype=np.float64)
+        self.spk = np.array(spk, dtype=np.int64)
+        self.order = np.array(order, dtype=np.int64)
+        self.speakers = list(codes.keys())
+
+    def _from_columns(self, meta):
+        # spk_id is -1 (missing) for noise segments
+        spk = np.asarray(meta.columns["spk_id"])
+        speech = spk >= 0
+        self.mix = np.repeat(np.arange(len(meta), dtype=np.int64), np.diff(meta.offsets))[speech]
+        self.start = np.asarray(meta.columns["start"], dtype=np.float64)[speech]
+        self.stop = np.asarray(meta.columns["stop"], dtype=np.float64)[speech]
+        order = meta.columns.get("sub_utt_num")
+        self.order = np.asarray(order, dtype=np.int64)[speech] if order is not None else np.zeros(len(self.mix),
+                                                                                                   dtype=np.int64)
+        # vocab codes are given in order of first appearance, so are the renumbered ones
+        vocab, spk = np.unique(spk[speech], return_inverse=True)
+        self.spk = spk.astype(np.int64)
+        self.speakers = [meta.vocabs["spk_id"][c] for c in vocab.tolist()]
+
+    def __len__(self):
+        return len(self.names)
+
+
+def overlap_frames(table, frame_rate=100):
+    # (n_mixtures, K + 1) frames with k active segments, k = 0 ... K (column 0 is unused), K >= MIN_SPK_KEYS.
+    # Segments cover frames int(start * frame_rate) to int(stop * frame_rate) excluded.
+    lo = (table.start * frame_rate).astype(np.int64)
+    hi = (table.stop * frame_rate).astype(np.int64)
+    mix = np.concatenate([table.mix, table.mix])
+    pos = np.concatenate([lo, hi])
+    delta = np.concatenate([np.ones(len(lo), dtype=np.int64), -np.ones(len(hi), dtype=np.int64)])
+    idx = np.lexsort((pos, mix))
+    mix, pos, delta = mix[idx], pos[idx], delta[idx]
+    # every mixture ends with 0 active segments so the running count does not leak into the next one
+    active = np.cumsum(delta)
+    gap = np.zeros(len(pos), dtype=np.int64)
+    same = mix[1:] == mix[:-1]
+    gap[:-1] = np.where(same, pos[1:] - pos[:-1], 0)
+    n_keys = max(MIN_SPK_KEYS, int(active.max(initial=0)))
+    counts = np.bincount(mix * (n_keys + 1) + active, weights=gap, minlength=len(table) * (n_keys + 1))
+    return counts.reshape(len(table), n_keys + 1).astype(np.int64)
+
+
+def overlap_stats(table, frame_rate=100):
+    # content of stats/overlaps.json : frames per mixture plus global_mean and global_tot
+    frames = overlap_frames(table, frame_rate)
+    keys = ["{}spk".format(k) for k in range(1, frames.shape[1])]
+    tot = frames[:, 1:].sum(axis=1)
+    out = {}
+    for name, t, row in zip(table.names, tot.tolist(), frames[:, 1:].tolist()):
+        out[name] = dict([("tot", t)] + list(zip(keys, row)))
+    columns = [tot] + [frames[:, k] for k in range(1, frames.shape[1])]
+    out["global_mean"] = {k: float(np.mean(c)) if len(c) else 0. for k, c in zip(["tot"] + keys, columns)}
+    out["global_tot"] = dict([("tot", float(tot.sum()))] +
+                             [(k, float(c.sum() / max(tot.sum(), 1))) for k, c in zip(keys, columns[1:])])
+    return out
+
+
+def speaker_stats(table):
+    # content of stats/speakers.json : seconds of speech per speaker (summed in metadata order)
+    seconds = np.bincount(table.spk, weights=table.stop - table.start, minlength=len(table.speakers))
+    return dict(zip(table.speakers, seconds.tolist()))
+
+
+def transition_ratios(table, ovr_ratio):
+    # (achieved, intended) overlap of each sub utterance with the previous one (sub_utt_num order) when it is
+    # from another speaker, as a ratio of the previous length. The overlap generator aims at ovr_ratio but
+    # the overlap can not be longer than the current utterance : intended = min(ovr_ratio, cur / prev length)
+    idx = np.lexsort((table.order, table.mix))
+    mix, start, stop, spk = table.mix[idx], table.start[idx], table.stop[idx], table.spk[idx]
+    pair = (mix[1:] == mix[:-1]) & (spk[1:] != spk[:-1])
+    prev_len = (stop[:-1] - start[:-1])[pair]
+    cur_len = (stop[1:] - start[1:])[pair]
+    overlap = np.maximum(np.minimum(stop[1:], stop[:-1]) - np.maximum(start[1:], start[:-1]), 0)[pair]
+    prev_len = np.maximum(prev_len, 1e-9)
+    return overlap / prev_len, np.minimum(ovr_ratio, cur_len / prev_len)
+
+
+def validate(table, ovr_ratio, tolerance=0.05, frame_rate=100):
+    # how close the overlap of a metadata file is to its target ratio
+    achieved, intended = transition_ratios(table, ovr_ratio)
+    deviation = np.abs(achieved - intended)
+    frames = overlap_frames(table, frame_rate)
+    speech = frames[:, 1:].sum()
+    return {"ovr_ratio": ovr_ratio, "mixtures": len(table), "transitions": len(achieved),
+            "achieved_mean": float(achieved.mean()) if len(achieved) else 0.,
+            "intended_mean": float(intended.mean()) if len(achieved) else 0.,
+            "mean_abs_deviation": float(deviation.mean()) if len(achieved) else 0.,
+            "within_tolerance": float(np.mean(deviation <= tolerance)) if len(achieved) else 1.,
+            "overlapped_speech": float(frames[:, 2:].sum() / max(speech, 1))}
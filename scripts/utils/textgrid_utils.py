@@ -1,7 +1,8 @@
-import tgt
 import os
 import glob
+import itertools
 from pathlib import Path
+import numpy as np
 
 def read_word_alignment(read_textgrid):
     read_tier_words = read_textgrid.get_tier_by_name('words')
@@ -17,9 +18,99 @@ def read_word_alignment(read_textgrid):
     return words, start_time, end_time
 
 
-def get_textgrid_sa(mfa_file, merge_shorter=0.15, pause_tokens=[""]):
+def _unquote(text):
+    # "text" -> text with Praat "" escapes removed
+    return text[1:-1].replace('""', '"')
+
+
+def _parse_long_words(lines, tier_name):
+    # lines of a long format TextGrid after the header, stops reading at the end of the tier
+    in_tier = False
+    words, start_time, end_time = [], [], []
+    xmin = xmax = None
+    for line in lines:
+        if line.startswith("item ["):
+            if in_tier:
+                break
+            continue
+        key, _, value = line.partition(" = ")
+        if key == "name":
+            in_tier = _unquote(value) == tier_name
+        elif not in_tier:
+            continue
+        elif key == "xmin":
+            xmin = value
+        elif key == "xmax":
+            xmax = value
+        elif key == "text":
+            text = _unquote(value)
+            if text.strip() != "": # empty intervals are pauses
+                words.append(text)
+                start_time.append(float(xmin))
+                end_time.append(float(xmax))
+    return words, start_time, end_time
+
+
+def _parse_short_words(lines, tier_name):
+    lines = list(lines)
+    index = 4 # "<exists>" and the number of tiers
+    words, start_time, end_time = [], [], []
+    while index < len(lines):
+        tier_class, name, n = lines[index], _unquote(lines[index + 1]), int(lines[index + 4])
+        step = 3 if tier_class == '"IntervalTier"' else 2
+        if name == tier_name and step == 3:
+            for i in range(index + 5, index + 5 + n * 3, 3):
+                text = _unquote(lines[i + 2])
+                if text.strip() != "":
+                    words.append(text)
+                    start_time.append(float(lines[i]))
+                    end_time.append(float(lines[i + 1]))
+            break
+        index += 5 + n * step
+    return words, start_time, end_time
+
+
+def read_words_tier(mfa_file, tier_name="words"):
+    """Lightweight TextGrid reader, returns (words, start, end) of the non empty intervals of one tier.
+
+    Gives the same result as tgt.read_textgrid + read_word_alignment but streams the file and only keeps
+    the requested tier, start and end are float64 arrays.
+    """
+    with open(mfa_file, "r", encoding="utf-8") as f:
+        # same line filtering as tgt: empty lines and lines with a single double quote are ignored
+        lines = (x.strip() for x in f)
+        lines = (x for x in lines if x not in ("", '"'))
+        header = [next(lines, ""), next(lines, "")]
+        if header not in (['File type = "ooTextFile"', 'Object class = "TextGrid"'],
+                          ['File type = "ooTextFile short"', '"TextGrid"']):
+            raise ValueError("Invalid TextGrid header in {}: {}".format(mfa_file, header))
+        # as in tgt the format is given by the first line after the header
+        first = next(lines, "")
+        if first.startswith("xmin"):
+            words, start_time, end_time = _parse_long_words(lines, tier_name)
+        else:
+            words, start_time, end_time = _parse_short_words(itertools.chain([first], lines), tier_name)
+    return words, np.array(start_time, dtype=np.float64), np.array(end_time, dtype=np.float64)
+
+
+def read_textgrid_words(mfa_file):
+    return read_words_tier(mfa_file, "words")
+
+
+def read_textgrid_words_tgt(mfa_file):
+    # reference implementation with the full tgt parser
+    import tgt
     read_textgrid = tgt.read_textgrid(mfa_file, include_empty_intervals=False)
-    [words, start_time, end_time] = read_word_alignment(read_textgrid)
+    return read_word_alignment(read_textgrid)
+
+
+def get_textgrid_sa(mfa_file, merge_shorter=0.15, pause_tokens=[""]):
+    [words, start_time, end_time] = read_textgrid_words(mfa_file)
+    return merge_word_alignment(words, start_time, end_time, merge_shorter, pause_tokens)
+
+
+def merge_word_alignment(words, start_time, end_time, merge_shorter=0.15, pause_tokens=[""]):
+    # words separated by pauses shorter than merge_shorter are merged in the same segment
     assert len(words) == len(start_time) == len(end_time)
     stack = []
     out_words = []
@@ -0,0 +1,89 @@
+import os
+import struct
+import functools
+import numpy as np
+
+# Memory mapped reads of uncompressed wav files (WHAM noises are 16 bit PCM). Only the requested window and
+# channel are converted to float, with the same scaling libsndfile uses (sf.read gives the same samples).
+# Anything else (compressed, 24 bit, RF64 ...) is left to soundfile: the readers return None.
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (format, bits per sample) -> dtype of the samples and scale to float
+SUPPORTED = {(WAVE_FORMAT_PCM, 16): ("<i2", 1.0 / 0x8000),
+             (WAVE_FORMAT_PCM, 32): ("<i4", 1.0 / 0x80000000),
+             (WAVE_FORMAT_IEEE_FLOAT, 32): ("<f4", 1.0),
+             (WAVE_FORMAT_IEEE_FLOAT, 64): ("<f8", 1.0)}
+
+
+def parse_wav_header(path):
+    # returns dict(offset, frames, channels, samplerate, dtype, scale) of the data chunk or None if unsupported
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"fmt ":
+                data = f.read(size)
+                if len(data) < 16:
+                    return None
+                tag, channels, samplerate, _, block_align, bits = struct.unpack("<HHIIHH", data[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE:
+                    if len(data) < 26:
+                        return None
+                    tag = struct.unpack("<H", data[24:26])[0] # first two bytes of the sub format GUID
+                fmt = (tag, bits, channels, samplerate, block_align)
+                if size % 2:
+                    f.seek(1, 1)
+            elif chunk_id == b"data":
+                if fmt is None or (fmt[0], fmt[1]) not in SUPPORTED:
+                    return None
+                tag, bits, channels, samplerate, block_align = fmt
+                dtype, scale = SUPPORTED[(tag, bits)]
+                if block_align != channels * np.dtype(dtype).itemsize:
+                    return None
+                offset = f.tell()
+                size = min(size, file_size - offset) # truncated files
+                return {"offset": offset, "frames": size // block_align, "channels": channels,
+                        "samplerate": samplerate, "dtype": dtype, "scale": scale}
+            else:
+                f.seek(size + size % 2, 1)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_header(path, mtime, size):
+    return parse_wav_header(path)
+
+
+def wav_header(path):
+    # parsed once per file, re-parsed if the file changes
+    st = os.stat(path)
+    return _cached_header(path, st.st_mtime_ns, st.st_size)
+
+
+def read_wav_window(path, start, stop, channel=None, dtype=np.float64):
+    """Frames start to stop of one channel of a PCM/float wav as (audio, samplerate), None if unsupported.
+
+    Same samples as sf.read(path, start=start, stop=stop)[:, channel] (or the mono signal), but the file is
+    memory mapped and only the selected samples are read and converted.
+    """
+    header = wav_header(path)
+    if header is None or (header["channels"] > 1 and channel is None):
+        return None
+    if header["frames"] == 0:
+        return np.zeros(0, dtype=dtype), header["samplerate"]
+    data = np.memmap(path, dtype=header["dtype"], mode="r", offset=header["offset"],
+                     shape=(header["frames"], header["channels"]))
+    window = data[start:stop, channel if header["channels"] > 1 else 0] # strided view, nothing is read yet
+    audio = window.astype(dtype)
+    if header["scale"] != 1.0:
+        audio *= header["scale"]
+    return audio, header["samplerate"]
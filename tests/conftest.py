@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the scripts import their helpers as utils.*, as when run from scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scripts"))
@@ -0,0 +1,40 @@
+import numpy as np
+import pyloudnorm
+import pytest
+from utils.loudness_utils import loudness_gains, integrated_loudness, GAIN_TOLERANCE_DB
+
+
+def random_segments(rate, n, rng):
+    # noise bursts of random level and length (0.1 s to 10 s) with silences, as sub utterances
+    signals = []
+    for _ in range(n):
+        length = rng.randint(int(0.1 * rate), 10 * rate)
+        gate = (rng.rand(length // 800 + 1) > 0.3).repeat(800)[:length]
+        signals.append(rng.randn(length) * rng.uniform(0.001, 0.5) * gate)
+    return signals
+
+
+@pytest.mark.parametrize("rate", [8000, 16000])
+def test_gains_match_pyloudnorm(rate):
+    rng = np.random.RandomState(rate)
+    signals = random_segments(rate, 20, rng)
+    targets = rng.uniform(-38, -25, len(signals))
+    gains = loudness_gains(signals, rate, targets)
+    for x, target, gain in zip(signals, targets, gains):
+        ref = pyloudnorm.Meter(rate, block_size=0.1).integrated_loudness(x)
+        expected = pyloudnorm.normalize.loudness(x, ref, target)
+        assert abs(20 * np.log10(gain) - (target - ref)) < GAIN_TOLERANCE_DB
+        np.testing.assert_allclose(x * gain, expected, rtol=1e-6, atol=0)
+
+
+@pytest.mark.parametrize("rate", [8000, 16000])
+def test_float32_close_to_float64(rate):
+    signals = random_segments(rate, 5, np.random.RandomState(0))
+    ref = integrated_loudness(signals, rate)
+    out = integrated_loudness([x.astype(np.float32) for x in signals], rate)
+    np.testing.assert_allclose(out, ref, atol=1e-3)
+
+
+def test_too_short():
+    with pytest.raises(ValueError):
+        integrated_loudness([np.zeros(100)], 8000)
@@ -0,0 +1,60 @@
+import glob
+import os
+import numpy as np
+import pytest
+from utils.textgrid_utils import read_words_tier, read_textgrid_words_tgt, merge_word_alignment
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "textgrids",
+                                         "*.TextGrid")))
+
+
+def fixture(name):
+    return next(f for f in FIXTURES if os.path.basename(f) == name)
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_same_words_as_tgt(path):
+    pytest.importorskip("tgt")
+    ref_words, ref_start, ref_end = read_textgrid_words_tgt(path)
+    words, start, end = read_words_tier(path)
+    assert words == ref_words
+    assert start.tolist() == list(ref_start)
+    assert end.tolist() == list(ref_end)
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+@pytest.mark.parametrize("merge_shorter", [0.0, 0.05, 0.15, 0.5])
+def test_same_segments_as_tgt(path, merge_shorter):
+    pytest.importorskip("tgt")
+    ref_stack, ref_words = merge_word_alignment(*read_textgrid_words_tgt(path), merge_shorter)
+    stack, out_words = merge_word_alignment(*read_words_tier(path), merge_shorter)
+    assert out_words == ref_words
+    assert [[float(x) for x in s] for s in stack] == [[float(x) for x in s] for s in ref_stack]
+
+
+def test_escaped_quotes_and_tier_order():
+    # words is the third tier, after a phones tier and a point tier
+    words, start, end = read_words_tier(fixture("1089-134686-0001.TextGrid"))
+    assert words == ["don't", 'say "hello"', '"', "o'clock"]
+    np.testing.assert_array_equal(start, [0.3, 0.66, 1.1, 1.9])
+    np.testing.assert_array_equal(end, [0.62, 1.1, 1.25, 2.4])
+
+
+def test_short_format():
+    words, start, end = read_words_tier(fixture("1089-134686-0002.TextGrid"))
+    assert words == ["stuff", "it", "into", "you"]
+    stack, out_words = merge_word_alignment(words, start, end, 0.15)
+    assert out_words == [["stuff", "it", "into"], ["you"]]
+    assert [[float(x) for x in s] for s in stack] == [[0.21, 1.4], [1.6, 2.02]]
+
+
+def test_silence_only():
+    words, start, end = read_words_tier(fixture("1089-134686-0004.TextGrid"))
+    assert words == [] and len(start) == len(end) == 0
+
+
+def test_invalid_header(tmp_path):
+    path = tmp_path / "bad.TextGrid"
+    path.write_text("not a textgrid\n")
+    with pytest.raises(ValueError):
+        read_words_tier(str(path))